@@ -0,0 +1,352 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+
+import tg_obj
+
+MAX_ALBUM_SIZE = 10
+
+
+class AlbumBatcher:
+    """Sender of photos collecting the photos to one chat into albums.
+
+    Photos sent to the same chat within `window` seconds after the first one
+    are sent with one sendMediaGroup request, up to 10 photos in an album.
+    A single photo is sent with sendPhoto. Each caller gets its own Message.
+
+    Args:
+        bot: Bot instance
+        window (float): seconds to wait for more photos to the chat
+    """
+
+    def __init__(self, bot, window=0.2):
+        self.bot = bot
+        self.window = window
+        self.pending = {}
+        self.timers = {}
+        self.tasks = set()
+
+    async def send_photo(self, chat_id, photo, caption=None, parse_mode=None, caption_entities=None, has_spoiler=None):
+        """Send the photo, possibly in an album with other photos to the chat.
+
+        Args:
+            See here: https://core.telegram.org/bots/api#inputmediaphoto
+        Returns:
+            The sent message with this photo as a Message instance
+        """
+
+        media = tg_obj.InputMediaPhoto(
+            media=photo,
+            caption=caption,
+            parse_mode=parse_mode,
+            caption_entities=caption_entities,
+            has_spoiler=has_spoiler
+        )
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        batch = self.pending.get(chat_id)
+        if batch is None:
+            batch = self.pending[chat_id] = []
+            self.timers[chat_id] = loop.call_later(self.window, self.__flush, chat_id)
+        batch.append((media, future))
+        if len(batch) == MAX_ALBUM_SIZE:
+            self.__flush(chat_id)
+        return await future
+
+    async def close(self):
+        """Send all collected photos and wait for the requests to finish"""
+        for chat_id in list(self.pending):
+            self.__flush(chat_id)
+        if self.tasks:
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    def __flush(self, chat_id):
+        self.timers.pop(chat_id).cancel()
+        task = asyncio.create_task(self.__send(chat_id, self.pending.pop(chat_id)))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def __send(self, chat_id, batch):
+        try:
+            if len(batch) == 1:
+                values = dict(batch[0][0].__dict__)
+                del values['type']
+                messages = [await self.bot.send_photo(chat_id, values.pop('media'), **values)]
+            else:
+                messages = await self.bot.send_media_group(chat_id, [media for media, _ in batch])
+        except Exception as error:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        for (_, future), message in zip(batch, messages):
+            if not future.done():
+                future.set_result(message)
+
+
+class MessageCoalescer:
+    """Merger of plain text messages sent to one chat within a short window.
+
+    Texts are joined with `separator` into one message up to `limit` characters.
+    Only messages with the same parse_mode are merged, a message with another
+    parse_mode or one that does not fit starts a new message. Merged messages
+    to one chat are sent in order. Each caller gets the merged Message.
+
+    Args:
+        send: coroutine function sending sendMessage parameters, returns Message
+        window (float): seconds to wait for more messages to the chat
+        limit (int): max length of the merged text
+        separator (str): string between merged texts
+    """
+
+    # Parameters of messages that can be merged
+    PARAMS = frozenset(('chat_id', 'text', 'parse_mode'))
+
+    def __init__(self, send, window=0.05, limit=4096, separator='\n'):
+        self.send = send
+        self.window = window
+        self.limit = limit
+        self.separator = separator
+        self.batches = {}
+        self.last_sends = {}
+
+    def can_merge(self, params):
+        """True if the message has only the parameters in `PARAMS` and its text is a str that fits"""
+        text = params.get('text')
+        return self.PARAMS.issuperset(params) and isinstance(text, str) and len(text) <= self.limit
+
+    async def send_message(self, params):
+        """Send the text message merged with other messages to the chat.
+
+        Args:
+            params (dict): parameters of sendMessage, see `can_merge`
+        Returns:
+            The sent merged message as a Message instance
+        """
+
+        chat_id = params['chat_id']
+        parse_mode = params.get('parse_mode')
+        text = params['text']
+        batch = self.batches.get(chat_id)
+        if batch is not None and (
+                batch['parse_mode'] != parse_mode
+                or batch['size'] + len(self.separator) + len(text) > self.limit
+        ):
+            self.flush(chat_id)
+            batch = None
+        loop = asyncio.get_running_loop()
+        if batch is None:
+            batch = self.batches[chat_id] = {
+                'parse_mode': parse_mode,
+                'texts': [text],
+                'size': len(text),
+                'futures': [],
+                'timer': loop.call_later(self.window, self.flush, chat_id),
+            }
+        else:
+            batch['texts'].append(text)
+            batch['size'] += len(self.separator) + len(text)
+        future = loop.create_future()
+        batch['futures'].append(future)
+        return await future
+
+    def flush(self, chat_id):
+        """Start sending the collected messages to the chat"""
+
+        batch = self.batches.pop(chat_id, None)
+        if batch is None:
+            return
+        batch['timer'].cancel()
+        previous = self.last_sends.get(chat_id)
+        task = self.last_sends[chat_id] = asyncio.create_task(self.__send(chat_id, batch, previous))
+        task.add_done_callback(lambda _: self.last_sends.get(chat_id) is task and self.last_sends.pop(chat_id))
+
+    async def drain(self, chat_id):
+        """Send the collected messages to the chat and wait until all merged messages are sent"""
+
+        self.flush(chat_id)
+        last_send = self.last_sends.get(chat_id)
+        if last_send is not None:
+            await asyncio.wait([last_send])
+
+    async def close(self):
+        for chat_id in list(self.batches):
+            self.flush(chat_id)
+        if self.last_sends:
+            await asyncio.wait(list(self.last_sends.values()))
+
+    async def __send(self, chat_id, batch, previous):
+        if previous is not None:
+            await asyncio.wait([previous])
+        params = {'chat_id': chat_id, 'text': self.separator.join(batch['texts'])}
+        if batch['parse_mode'] is not None:
+            params['parse_mode'] = batch['parse_mode']
+        try:
+            message = await self.send(params)
+        except Exception as error:
+            for future in batch['futures']:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        for future in batch['futures']:
+            if not future.done():
+                future.set_result(message)
+
+
+class EditDebouncer:
+    """Sender of edits of messages that sends only the latest state of each message.
+
+    Edits of one message (chat_id, message_id) are sent not more often than once
+    in `interval` seconds. An edit waiting to be sent is replaced by a newer edit
+    with the same method, and the callers of both get the result of the newer one.
+    An edit with the same content as the newest state of the message, the edit being
+    sent or the last applied one, is not sent, the error "message is not modified"
+    is also taken as success.
+
+    Args:
+        bot: Bot instance
+        interval (float): min seconds between edits of one message
+        max_messages (int): number of messages to remember the last applied state of
+    """
+
+    def __init__(self, bot, interval=1.0, max_messages=10000):
+        self.bot = bot
+        self.interval = interval
+        self.max_messages = max_messages
+        self.states = OrderedDict()
+        self.sent = 0
+        self.skipped = 0
+
+    async def edit_text(self, chat_id, message_id, text, **params):
+        return await self.edit('editMessageText', chat_id, message_id, text=text, **params)
+
+    async def edit_caption(self, chat_id, message_id, caption=None, **params):
+        return await self.edit('editMessageCaption', chat_id, message_id, caption=caption, **params)
+
+    async def edit_reply_markup(self, chat_id, message_id, reply_markup=None):
+        return await self.edit('editMessageReplyMarkup', chat_id, message_id, reply_markup=reply_markup)
+
+    async def edit(self, method, chat_id, message_id, **params):
+        """Schedule the edit of the message, replacing the not yet sent edit with the same method.
+
+        Args:
+            method (str): name of the bot api method, e.g. 'editMessageText'
+            chat_id: chat of the message
+            message_id (int): id of the message
+            params: other parameters of the method
+        Returns:
+            Result of the edit that was sent for this one, the result of the last applied edit
+            if the content has not changed or True if it is not known
+        """
+
+        api_method = self.bot.api_methods[method]
+        params = {'chat_id': chat_id, 'message_id': message_id, **params}
+        params = {name: value for name, value in params.items() if value is not None}
+        content_hash = hashlib.blake2b(api_method.encode(params), digest_size=16).digest()
+
+        key = (chat_id, message_id)
+        state = self.__get_state(key)
+        pending = state['pending'].get(method)
+        in_flight = state['in_flight'].get(method)
+        if in_flight is not None:
+            if in_flight[0] == content_hash:
+                # The edit being sent is the latest state, its callers get its result
+                self.skipped += 1
+                future = asyncio.get_running_loop().create_future()
+                in_flight[1].append(future)
+                if pending is not None:
+                    del state['pending'][method]
+                    in_flight[1].extend(pending[2])
+                return await future
+            applied = None
+        else:
+            applied = state['applied'].get(method)
+        if applied is not None and applied[0] == content_hash:
+            # The latest state is already applied, the pending edit is not needed anymore
+            self.skipped += 1
+            if pending is not None:
+                del state['pending'][method]
+                self.__resolve(pending[2], applied[1])
+            return applied[1]
+
+        future = asyncio.get_running_loop().create_future()
+        if pending is not None:
+            self.skipped += 1
+            futures = pending[2]
+            futures.append(future)
+        else:
+            futures = [future]
+        state['pending'][method] = (params, content_hash, futures)
+        if state['task'] is None:
+            state['task'] = asyncio.create_task(self.__run(key, state))
+        return await future
+
+    async def close(self):
+        """Wait until all pending edits are sent"""
+
+        tasks = [state['task'] for state in self.states.values() if state['task'] is not None]
+        if tasks:
+            await asyncio.wait(tasks)
+
+    def __get_state(self, key):
+        state = self.states.get(key)
+        if state is None:
+            if len(self.states) >= self.max_messages:
+                self.__drop_idle_states()
+            state = self.states[key] = {
+                'pending': {}, 'in_flight': {}, 'applied': {}, 'next_at': 0.0, 'task': None
+            }
+        else:
+            self.states.move_to_end(key)
+        return state
+
+    def __drop_idle_states(self):
+        for key in list(self.states):
+            if len(self.states) < self.max_messages:
+                break
+            if self.states[key]['task'] is None:
+                del self.states[key]
+
+    async def __run(self, key, state):
+        try:
+            while state['pending']:
+                delay = state['next_at'] - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                    if not state['pending']:
+                        break
+                method = next(iter(state['pending']))
+                params, content_hash, futures = state['pending'].pop(method)
+                state['next_at'] = time.monotonic() + self.interval
+                # Callers of an edit with the same content join `futures` while it is sent
+                state['in_flight'][method] = (content_hash, futures)
+                try:
+                    res = await self.bot.call_api(method, params)
+                except tg_obj.TgHTTPStatusError as error:
+                    if error.response.status_code != 400 or 'message is not modified' not in error.response.text:
+                        self.__reject(futures, error)
+                        continue
+                    res = True
+                except Exception as error:
+                    self.__reject(futures, error)
+                    continue
+                finally:
+                    del state['in_flight'][method]
+                self.sent += 1
+                state['applied'][method] = (content_hash, res)
+                self.__resolve(futures, res)
+        finally:
+            state['task'] = None
+
+    @staticmethod
+    def __resolve(futures, res):
+        for future in futures:
+            if not future.done():
+                future.set_result(res)
+
+    @staticmethod
+    def __reject(futures, error):
+        for future in futures:
+            if not future.done():
+                future.set_exception(error)
@@ -0,0 +1,347 @@
+import argparse
+import asyncio
+import httpx
+import json
+import os
+import statistics
+import sys
+import time
+import timeit
+import tg_obj
+import tracemalloc
+
+from bot import Bot
+from mock_transport import CHAT, KEYBOARD, USER, MockBotApi, make_message
+from retry import RetryPolicy
+from router import Router
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks.json')
+# Metrics that do not depend on the speed of the machine: ratios of timings measured in the same run
+# (higher is better) and sizes in bytes (lower is better). Only they are saved and compared.
+RELATIVE_SUFFIXES = ('_speedup', '_bytes')
+
+
+def time_in_turns(funcs, number, repeat=7):
+    """Time the functions called in turns, `number` calls each in every one of `repeat` rounds.
+
+    Returns:
+        (times, speedups): seconds per call of each function, the best of the rounds,
+        and the median over the rounds of the time of the first function to the time of each one.
+        The ratios vary much less than the times on a busy machine, as both are slowed down alike
+    """
+
+    rounds = [[timeit.timeit(func, number=number) / number for func in funcs] for _ in range(repeat)]
+    times = [min(func_times) for func_times in zip(*rounds)]
+    speedups = [statistics.median(times[0] / times[i] for times in rounds) for i in range(len(funcs))]
+    return times, speedups
+
+
+def bench_parse(number=1000):
+    """Compare `Message.parse_obj` with `Message.parse_trusted` on the same json"""
+
+    raw = json.dumps(make_message(2)).encode()
+    (validated, trusted), (_, speedup) = time_in_turns(
+        (lambda: tg_obj.Message.parse_obj(json.loads(raw)), lambda: tg_obj.Message.parse_trusted(raw)), number
+    )
+    print(f'Message.parse_obj:     {validated * 1e6:8.1f} us')
+    print(f'Message.parse_trusted: {trusted * 1e6:8.1f} us ({speedup:.1f}x faster, '
+          f'orjson {"on" if tg_obj.orjson else "off"})')
+    return {'parse_obj_us': validated * 1e6, 'parse_trusted_us': trusted * 1e6, 'parse_trusted_speedup': speedup}
+
+
+def bench_lazy(batch=100, number=10):
+    """Compare eager and lazy parsing of a batch of updates read by a typical handler"""
+
+    raw = json.dumps([{'update_id': i, 'message': make_message(i + 1)} for i in range(batch)]).encode()
+
+    def read(updates):
+        for update in updates:
+            message = update.message
+            message.text, message.chat.id, message.from_.id
+
+    parsers = {
+        'Update.parse_obj': lambda: [tg_obj.Update.parse_obj(update) for update in json.loads(raw)],
+        'Update.parse_trusted': lambda: [tg_obj.Update.build_trusted(update) for update in tg_obj.loads(raw)],
+        'LazyUpdate': lambda: [tg_obj.LazyUpdate(update) for update in tg_obj.loads(raw)],
+    }
+    times, speedups = time_in_turns([lambda parse=parse: read(parse()) for parse in parsers.values()], number)
+    metrics = {}
+    for (name, parse), seconds, speedup in zip(parsers.items(), times, speedups):
+        tracemalloc.start()
+        updates = parse()
+        read(updates)
+        kept, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del updates
+        print(f'{name:21} {seconds / batch * 1e6:8.1f} us per update, peak {peak / 1024:8.1f} KiB per batch, '
+              f'{kept / batch:8.0f} bytes kept per update')
+        key = name.replace('.', '_')
+        metrics[f'{key}_us'] = seconds / batch * 1e6
+        metrics[f'{key}_bytes'] = kept / batch
+        if name != 'Update.parse_obj':
+            metrics[f'{key}_speedup'] = speedup
+    return metrics
+
+
+def bench_keyboard(number=1000):
+    """Compare serialization of the 3x3 keyboard with the frozen keyboard"""
+
+    keyboard = tg_obj.InlineKeyboardMarkup.parse_obj(KEYBOARD)
+    frozen = tg_obj.FrozenInlineKeyboardMarkup.parse_obj(KEYBOARD)
+    (plain, cached), (_, speedup) = time_in_turns((keyboard.json, frozen.json), number)
+    print(f'InlineKeyboardMarkup.json():       {plain * 1e6:8.2f} us')
+    print(f'FrozenInlineKeyboardMarkup.json(): {cached * 1e6:8.2f} us')
+    return {
+        'keyboard_json_us': plain * 1e6,
+        'frozen_keyboard_json_us': cached * 1e6,
+        'frozen_keyboard_json_speedup': speedup,
+    }
+
+
+def bench_call(number=2000):
+    """Measure the overhead of the declarative call path and the whole send_message call over a mock transport"""
+
+    keyboard = tg_obj.FrozenInlineKeyboardMarkup.parse_obj(KEYBOARD)
+    method = Bot.send_message
+    overhead = timeit.timeit(
+        lambda: method.encode(method.get_params((1, 'text'), {'reply_markup': keyboard})),
+        number=number
+    ) / number
+
+    async def send_messages():
+        async with httpx.AsyncClient(transport=MockBotApi().transport()) as session:
+            bot = Bot('token', session, trusted=True)
+            start = time.perf_counter()
+            for _ in range(number):
+                await bot.send_message(1, 'text', reply_markup=keyboard)
+            return (time.perf_counter() - start) / number
+
+    call = asyncio.run(send_messages())
+    print(f'ApiMethod params:  {overhead * 1e6:8.1f} us')
+    print(f'Bot.send_message:  {call * 1e6:8.1f} us ({1 / call:.0f} calls/s)')
+    return {'api_method_params_us': overhead * 1e6, 'send_message_us': call * 1e6}
+
+
+def bench_throughput(number=2000, concurrency=100, latency=0.005, flood_every=50, retry_after=0.01):
+    """Measure send_message calls per second with concurrent callers over a mock transport
+    answering after `latency` seconds and with the error 429 to every `flood_every`-th request"""
+
+    async def send_messages():
+        api = MockBotApi(latency=latency, flood_every=flood_every, retry_after=retry_after)
+        limits = httpx.Limits(max_connections=None)
+        async with httpx.AsyncClient(transport=api.transport(), limits=limits) as session:
+            bot = Bot('token', session, retry_policy=RetryPolicy(max_attempts=10))
+            chat_ids = iter(range(number))
+
+            async def worker():
+                for chat_id in chat_ids:
+                    await bot.send_message(chat_id, 'text')
+
+            start = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            return time.perf_counter() - start, api
+
+    seconds, api = asyncio.run(send_messages())
+    print(f'{number} x send_message, {concurrency} concurrent, latency {latency * 1e3:.0f} ms: '
+          f'{number / seconds:8.0f} calls/s, {api.flooded} errors 429 retried')
+    return {'send_message_calls_per_s': number / seconds}
+
+
+def bench_wire(number=100, repeat=7):
+    """Compare the old GET query string with the JSON POST body for a 4096-char message with a large keyboard"""
+
+    text = ('Сообщение с длинным текстом & символами? ' * 100)[:4096]
+    keyboard = tg_obj.InlineKeyboardMarkup(inline_keyboard=[
+        [tg_obj.InlineKeyboardButton(text=f'Кнопка {row}-{column}', callback_data=f'action:{row}:{column}:' + 'x' * 40)
+         for column in range(8)]
+        for row in range(10)
+    ])
+    url = 'https://api.telegram.org/bottoken/sendMessage'
+
+    def get_request():
+        params = {'chat_id': 1, 'text': text, 'reply_markup': keyboard.json()}
+        return httpx.Request('GET', url, params=params)
+
+    def post_request():
+        params = {'chat_id': 1, 'text': text, 'reply_markup': keyboard}
+        return httpx.Request('POST', url, content=Bot.send_message.encode(params), headers={'Content-Type': 'application/json'})
+
+    def wire_size(request):
+        return len(request.method) + len(str(request.url)) + len(request.content) + sum(
+            len(name) + len(value) + 4 for name, value in request.headers.raw
+        )
+
+    async def send(build_request):
+        async with httpx.AsyncClient(transport=MockBotApi().transport()) as session:
+            start = time.perf_counter()
+            for _ in range(number):
+                await session.send(build_request())
+            return (time.perf_counter() - start) / number
+
+    # Both requests are sent in turns, see `time_in_turns`
+    rounds = [(asyncio.run(send(get_request)), asyncio.run(send(post_request))) for _ in range(repeat)]
+    requests = (('GET query', get_request), ('POST json', post_request))
+    metrics = {}
+    for (name, build_request), seconds in zip(requests, map(min, zip(*rounds))):
+        request = build_request()
+        print(f'{name}: url {len(str(request.url)):6} bytes, body {len(request.content):6} bytes, '
+              f'total {wire_size(request):6} bytes, {seconds * 1e6:8.1f} us per request')
+        key = name.split()[0].lower()
+        metrics[f'wire_{key}_bytes'] = wire_size(request)
+        metrics[f'wire_{key}_us'] = seconds * 1e6
+    metrics['wire_post_speedup'] = statistics.median(get / post for get, post in rounds)
+    return metrics
+
+
+def bench_router(handlers=500, number=400):
+    """Compare the router with checking a list of filters one by one for `handlers` commands and prefixes"""
+
+    async def handler(update):
+        pass
+
+    router = Router()
+    filters = []
+    for i in range(handlers):
+        router.add_command(f'command{i}', handler)
+        router.add_callback(f'action{i}:', handler)
+        filters.append((
+            lambda update, text=f'/command{i}': getattr(getattr(update, 'message', None), 'text', None) == text,
+            handler
+        ))
+        filters.append((
+            lambda update, prefix=f'action{i}:': getattr(
+                getattr(update, 'callback_query', None), 'data', ''
+            ).startswith(prefix),
+            handler
+        ))
+
+    last = handlers - 1
+    updates = [
+        tg_obj.Update.parse_obj({'update_id': 1, 'message': {**make_message(2), 'text': f'/command{last}'}}),
+        tg_obj.Update.parse_obj({'update_id': 2, 'callback_query': {
+            'id': '1', 'from': USER, 'chat_instance': '1', 'data': f'action{last}:page:2'
+        }}),
+    ]
+    def scan(update):
+        for check, handler in filters:
+            if check(update):
+                return handler
+
+    (linear, indexed), (_, speedup) = time_in_turns(
+        (lambda: [scan(update) for update in updates], lambda: [router.resolve(update) for update in updates]), number
+    )
+    linear, indexed = linear / len(updates), indexed / len(updates)
+    print(f'{handlers * 2} handlers, list of filters: {linear * 1e6:8.2f} us per update')
+    print(f'{handlers * 2} handlers, Router:          {indexed * 1e6:8.2f} us per update')
+    return {'filter_scan_us': linear * 1e6, 'router_us': indexed * 1e6, 'router_speedup': speedup}
+
+
+def bench_memory(number=1_000_000):
+    """Compare memory of the models and their compact variants on `number` objects"""
+
+    entity = {'type': 'text_mention', 'offset': 0, 'length': 4, 'user': USER}
+    samples = {
+        'User': (tg_obj.User, tg_obj.CompactUser, USER),
+        'Chat': (tg_obj.Chat, tg_obj.CompactChat, CHAT),
+        'MessageEntity': (tg_obj.MessageEntity, tg_obj.CompactMessageEntity, entity),
+    }
+    metrics = {}
+    for name, (model, compact, data) in samples.items():
+        tracemalloc.start()
+        objects = [model.build_trusted({**data, 'offset': i} if 'offset' in data else {**data, 'id': i})
+                   for i in range(number)]
+        model_size = tracemalloc.get_traced_memory()[0]
+        objects = [compact.from_model(obj) for obj in objects]
+        compact_size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del objects
+        print(f'{number} x {name:14} model {model_size / 2 ** 20:8.1f} MiB, '
+              f'compact {compact_size / 2 ** 20:8.1f} MiB ({model_size / compact_size:.1f}x smaller)')
+        metrics[f'{name}_bytes'] = model_size / number
+        metrics[f'Compact{name}_bytes'] = compact_size / number
+    return metrics
+
+
+BENCHMARKS = {
+    'parse': bench_parse,
+    'lazy': bench_lazy,
+    'keyboard': bench_keyboard,
+    'call': bench_call,
+    'throughput': bench_throughput,
+    'wire': bench_wire,
+    'router': bench_router,
+    'memory': bench_memory,
+}
+
+
+def relative_metrics(results):
+    """Get only the metrics not depending on the speed of the machine, see `RELATIVE_SUFFIXES`"""
+
+    relative = {}
+    for bench, metrics in results.items():
+        metrics = {name: value for name, value in metrics.items() if name.endswith(RELATIVE_SUFFIXES)}
+        if metrics:
+            relative[bench] = metrics
+    return relative
+
+
+def compare(results, baseline, tolerance=0.2, speedup_tolerance=0.5):
+    """Print the change of each relative metric against the baseline.
+
+    Absolute timings depend on the machine and are not compared. Metrics ending with `_speedup`
+    are better when higher, the ones ending with `_bytes` when lower.
+
+    Args:
+        results (dict): metrics by benchmark name
+        baseline (dict): saved metrics by benchmark name
+        tolerance (float): relative growth of a size taken as a regression
+        speedup_tolerance (float): relative drop of a speedup taken as a regression, the ratios of timings
+            also differ between machines and python versions, so only a large drop is a regression
+    Returns:
+        list of names of the regressed metrics
+    """
+
+    regressions = []
+    for bench, metrics in relative_metrics(results).items():
+        for name, value in metrics.items():
+            old = baseline.get(bench, {}).get(name)
+            if not old or not value:
+                continue
+            change = value / old - 1
+            if name.endswith('_speedup'):
+                regressed = -change > speedup_tolerance
+            else:
+                regressed = change > tolerance
+            mark = 'REGRESSION' if regressed else ''
+            if mark:
+                regressions.append(f'{bench}.{name}')
+            print(f'{bench}.{name:32} {old:12.2f} -> {value:12.2f} ({change:+7.1%}) {mark}')
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Offline benchmarks of the bot over a mock transport')
+    parser.add_argument('names', nargs='*', help=f'benchmarks to run, all by default: {", ".join(BENCHMARKS)}')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='json file with the baseline metrics')
+    parser.add_argument('--save', action='store_true', help='save the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='relative growth of a size taken as a regression')
+    parser.add_argument(
+        '--speedup-tolerance', type=float, default=0.5, help='relative drop of a speedup taken as a regression'
+    )
+    args = parser.parse_args()
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f'unknown benchmarks: {", ".join(unknown)}')
+
+    results = {name: BENCHMARKS[name]() for name in args.names or BENCHMARKS}
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as file:
+            baseline = json.load(file)
+    if args.save:
+        with open(args.baseline, 'w', encoding='utf-8') as file:
+            json.dump({**relative_metrics(baseline), **relative_metrics(results)}, file, indent=2)
+    elif baseline:
+        print()
+        if compare(results, baseline, args.tolerance, args.speedup_tolerance):
+            sys.exit(1)
@@ -1,204 +1,620 @@
+import asyncio
 import httpx
 import tg_obj
+import time
+
+from batching import MessageCoalescer
+from broadcast import Broadcast
+from media import FileIdCache, get_file_id
+from methods import ApiMethod
+from metrics import Metrics
+from rate_limiter import RateLimiter
+from retry import RetryPolicy
 
 
 class Bot:
-    """The class of tg bot methods"""
+    """The class of tg bot methods
 
-    def __init__(self, tg_token: str, session: httpx.AsyncClient):
-        self.url_start = f'https://api.telegram.org/bot{tg_token}/'
-        self.session = session
+    Methods of the bot api are declared as ApiMethod attributes, see `methods.ApiMethod`.
+    Any other method can be called with `call_api`.
+    """
 
-    async def send_message(
+    def __init__(
             self,
-            chat_id,
-            text,
-            parse_mode=None,
-            entities=None,
-            disable_web_page_preview=None,
-            disable_notification=None,
-            protect_content=None,
-            message_thread_id=None,
-            allow_sending_without_reply=None,
-            reply_markup=None,
+            tg_token: str,
+            session: httpx.AsyncClient,
+            rate_limiter: RateLimiter = None,
+            retry_policy: RetryPolicy = None,
+            trusted: bool = False,
+            file_id_cache: FileIdCache = None,
+            coalesce_window: float = None,
+            base_url: str = 'https://api.telegram.org',
+            metrics: Metrics = None
     ):
+        """
+        Args:
+            tg_token (str): token of the bot
+            session: httpx.AsyncClient instance for all requests
+            rate_limiter: RateLimiter instance to pace the requests, None to send them at once
+            retry_policy: RetryPolicy instance to repeat failed requests, None to not repeat them
+            trusted (bool): build the returned models without validation, see `BaseModel.parse_trusted`
+            file_id_cache: FileIdCache instance to send known media by file_id, None to always send it as given
+            coalesce_window (float): seconds within which plain text messages to one chat are merged,
+                see `batching.MessageCoalescer`, None to send every message as is
+            base_url (str): url of the bot api server, e.g. a local server or `fake_server.FakeBotApi`
+            metrics: Metrics instance to record counts and latencies of the calls by method, None to not record them
+        """
 
-        """Use this method to send text messages.
+        self.url_start = f'{base_url.rstrip("/")}/bot{tg_token}/'
+        self.urls = {name: self.url_start + name for name in self.api_methods}
+        self.session = session
+        self.rate_limiter = rate_limiter
+        self.retry_policy = retry_policy
+        self.trusted = trusted
+        self.file_id_cache = file_id_cache
+        self.metrics = metrics
+        self.coalescer = None
+        if coalesce_window is not None:
+            self.coalescer = MessageCoalescer(self.__send_merged_message, coalesce_window)
+
+    get_me = ApiMethod(
+        'getMe',
+        result=tg_obj.User,
+        doc="""A simple method for testing your bot's authentication token.
+
+        See here: https://core.telegram.org/bots/api#getme
+        Returns:
+            Basic information about the bot as a User instance
+        """
+    )
 
-        Args:
-            See here https://core.telegram.org/bots/api#sendmessage
+    send_message = ApiMethod(
+        'sendMessage',
+        'chat_id text parse_mode entities disable_web_page_preview disable_notification protect_content '
+        'message_thread_id allow_sending_without_reply reply_markup reply_to_message_id',
+        required=2,
+        result=tg_obj.Message,
+        doc="""Use this method to send text messages.
+
+        See here https://core.telegram.org/bots/api#sendmessage
         Returns:
             On success, the sent message is returned as a Message instance
         """
+    )
 
-        params = await self.__clean_params(locals())
-        url = self.url_start + 'sendMessage'
-        response = await self.session.get(url, params=params, follow_redirects=True)
-        await self.__tg_raise_for_status(response)
-        res = response.json().get('result')
-        return tg_obj.Message.parse_obj(res)
+    forward_message = ApiMethod(
+        'forwardMessage',
+        'chat_id from_chat_id message_id message_thread_id disable_notification protect_content',
+        required=3,
+        result=tg_obj.Message,
+        doc="""Use this method to forward messages of any kind.
 
-    async def set_webhook(
-            self,
-            url,
-            certificate=None,
-            ip_address=None,
-            max_connections=None,
-            allowed_updates=None,
-            drop_pending_updates=None,
-            secret_token=None
-    ):
-        """Use this method to specify a URL and receive incoming updates via an outgoing webhook.
+        See here: https://core.telegram.org/bots/api#forwardmessage
+        Returns:
+            On success, the sent message is returned as a Message instance
+        """
+    )
+
+    copy_message = ApiMethod(
+        'copyMessage',
+        'chat_id from_chat_id message_id message_thread_id caption parse_mode caption_entities '
+        'disable_notification protect_content reply_to_message_id allow_sending_without_reply reply_markup',
+        required=3,
+        doc="""Use this method to copy messages of any kind.
+
+        See here: https://core.telegram.org/bots/api#copymessage
+        Returns:
+            The MessageId of the sent message as dict
+        """
+    )
+
+    send_photo = ApiMethod(
+        'sendPhoto',
+        'chat_id photo message_thread_id caption parse_mode caption_entities has_spoiler disable_notification '
+        'protect_content reply_to_message_id allow_sending_without_reply reply_markup',
+        required=2,
+        result=tg_obj.Message,
+        doc="""Use this method to send photos. On success, the sent Message is returned
+
+        photo is a file_id, a URL or a file to upload, see `media.InputFile`.
+        See here: https://core.telegram.org/bots/api#sendphoto
+        Returns:
+            On success, the sent message is returned as a Message instance
+        """
+    )
+
+    send_document = ApiMethod(
+        'sendDocument',
+        'chat_id document message_thread_id thumbnail caption parse_mode caption_entities '
+        'disable_content_type_detection disable_notification protect_content reply_to_message_id '
+        'allow_sending_without_reply reply_markup',
+        required=2,
+        result=tg_obj.Message,
+        doc="""Use this method to send general files.
+        On success, the sent Message is returned. Bots can currently send files
+        of any type of up to 50 MB in size, this limit may be changed in the future.
+
+        document is a file_id, a URL or a file to upload, see `media.InputFile`.
+        See here: https://core.telegram.org/bots/api#senddocument
+        Returns:
+            On success, the sent message is returned as a Message instance
+        """
+    )
+
+    send_media_group = ApiMethod(
+        'sendMediaGroup',
+        'chat_id media message_thread_id disable_notification protect_content reply_to_message_id '
+        'allow_sending_without_reply',
+        required=2,
+        result=tg_obj.Message,
+        doc="""Use this method to send a group of photos, videos, documents or audios as an album.
+
+        media is a list of 2-10 InputMediaPhoto, InputMediaVideo, InputMediaDocument or InputMediaAudio.
+        See here: https://core.telegram.org/bots/api#sendmediagroup
+        Returns:
+            On success, a list of the sent Message instances
+        """
+    )
+
+    send_location = ApiMethod(
+        'sendLocation',
+        'chat_id latitude longitude message_thread_id horizontal_accuracy live_period heading '
+        'proximity_alert_radius disable_notification protect_content reply_to_message_id '
+        'allow_sending_without_reply reply_markup',
+        required=3,
+        result=tg_obj.Message,
+        doc="""Use this method to send point on the map.
+
+        See here: https://core.telegram.org/bots/api#sendlocation
+        Returns:
+            On success, the sent message is returned as a Message instance
+        """
+    )
+
+    edit_message_live_location = ApiMethod(
+        'editMessageLiveLocation',
+        'latitude longitude chat_id message_id inline_message_id horizontal_accuracy heading '
+        'proximity_alert_radius reply_markup',
+        required=2,
+        result=tg_obj.Message,
+        doc="""Use this method to edit live location messages.
+
+        A location can be edited until its live_period expires or editing is explicitly
+        disabled by a call to stopMessageLiveLocation.
+
+        See here: https://core.telegram.org/bots/api#editmessagelivelocation
+        Returns:
+            On success, if the edited message is not an inline message,
+            the edited Message is returned, otherwise True is returned.
+        """
+    )
+
+    stop_message_live_location = ApiMethod(
+        'stopMessageLiveLocation',
+        'chat_id message_id inline_message_id reply_markup',
+        result=tg_obj.Message,
+        doc="""Use this method to stop updating a live location message before live_period expires.
+
+        See here: https://core.telegram.org/bots/api#stopmessagelivelocation
+        Returns:
+            On success, if the message is not an inline message,
+            the edited Message is returned, otherwise True is returned.
+        """
+    )
+
+    send_chat_action = ApiMethod(
+        'sendChatAction',
+        'chat_id action message_thread_id',
+        required=2,
+        doc="""Use this method when you need to tell the user that something is happening on the bot's side.
+
+        See here: https://core.telegram.org/bots/api#sendchataction
+        Returns:
+            True on success
+        """
+    )
+
+    get_chat = ApiMethod(
+        'getChat',
+        'chat_id',
+        required=1,
+        result=tg_obj.Chat,
+        doc="""Use this method to get up to date information about the chat.
+
+        See here: https://core.telegram.org/bots/api#getchat
+        Returns:
+            Chat instance on success
+        """
+    )
+
+    get_file = ApiMethod(
+        'getFile',
+        'file_id',
+        required=1,
+        doc="""Use this method to get basic information about a file and prepare it for downloading.
+
+        See here: https://core.telegram.org/bots/api#getfile
+        Returns:
+            File object as dict on success
+        """
+    )
+
+    answer_callback_query = ApiMethod(
+        'answerCallbackQuery',
+        'callback_query_id text show_alert url cache_time',
+        required=1,
+        doc="""Use this method to send answers to callback queries sent from inline keyboards.
+        The answer will be displayed to the user as a notification at the top of the chat
+        screen or as an alert. On success, True is returned.
+
+        See here: https://core.telegram.org/bots/api#answercallbackquery
+        Returns:
+            On success, True is returned
+        """
+    )
+
+    edit_message_text = ApiMethod(
+        'editMessageText',
+        'text chat_id message_id inline_message_id parse_mode entities disable_web_page_preview reply_markup',
+        required=1,
+        result=tg_obj.Message,
+        doc="""Use this method to edit text and game messages.
+
+        See here: https://core.telegram.org/bots/api#editmessagetext
+        Returns:
+            On success, if the edited message is not an inline message,
+            the edited Message is returned, otherwise True is returned.
+        """
+    )
+
+    edit_message_caption = ApiMethod(
+        'editMessageCaption',
+        'chat_id message_id inline_message_id caption parse_mode caption_entities reply_markup',
+        result=tg_obj.Message,
+        doc="""Use this method to edit captions of messages.
+
+        See here: https://core.telegram.org/bots/api#editmessagecaption
+        Returns:
+            On success, if the edited message is not an inline message,
+            the edited Message is returned, otherwise True is returned.
+        """
+    )
+
+    edit_message_reply_markup = ApiMethod(
+        'editMessageReplyMarkup',
+        'chat_id message_id inline_message_id reply_markup',
+        result=tg_obj.Message,
+        doc="""Use this method to edit only the reply markup of messages.
+
+        See here: https://core.telegram.org/bots/api#editmessagereplymarkup
+        Returns:
+            On success, if the edited message is not an inline message,
+            the edited Message is returned, otherwise True is returned.
+        """
+    )
+
+    delete_message = ApiMethod(
+        'deleteMessage',
+        'chat_id message_id',
+        required=2,
+        doc="""Use this method to delete a message, including service messages.
+
+        See here: https://core.telegram.org/bots/api#deletemessage
+        Returns:
+            True on success
+        """
+    )
+
+    set_webhook = ApiMethod(
+        'setWebhook',
+        'url certificate ip_address max_connections allowed_updates drop_pending_updates secret_token',
+        required=1,
+        doc="""Use this method to specify a URL and receive incoming updates via an outgoing webhook.
 
         Whenever there is an update for the bot, we will send an HTTPS POST request to the specified URL,
         containing a JSON-serialized Update.
         In case of an unsuccessful request, we will give up after a reasonable amount of attempts.
 
-        Args:
-            See here https://core.telegram.org/bots/api#setwebhook
+        See here https://core.telegram.org/bots/api#setwebhook
         Returns:
             True on success
         """
+    )
 
-        params = await self.__clean_params(locals())
-        request_url = self.url_start + 'setWebhook'
-        response = await self.session.post(request_url, params=params, follow_redirects=True)
-        await self.__tg_raise_for_status(response)
-        return response.json()
+    delete_webhook = ApiMethod(
+        'deleteWebhook',
+        'drop_pending_updates',
+        doc="""Use this method to remove webhook integration if you decide to switch back to getUpdates.
 
-    async def delete_webhook(
-            self,
-            drop_pending_updates=None
-    ):
-        """Use this method to remove webhook integration if you decide to switch back to getUpdates.
         See here: https://core.telegram.org/bots/api#deletewebhook
-
-        Args:
-            drop_pending_updates (bool): Pass True to drop all pending updates
         Returns:
             True on success.
         """
+    )
 
-        request_url = self.url_start + 'deleteWebhook'
-        params = None
-        if drop_pending_updates:
-            params = {'drop_pending_updates': drop_pending_updates}
-        response = await self.session.post(request_url, params=params, follow_redirects=True)
-        await self.__tg_raise_for_status(response)
-        return response.json()
+    get_webhook_info = ApiMethod(
+        'getWebhookInfo',
+        doc="""Use this method to get current webhook status.
+
+        See here: https://core.telegram.org/bots/api#getwebhookinfo
+        Returns:
+            WebhookInfo object as dict
+        """
+    )
 
-    async def send_photo(
+    __get_updates = ApiMethod('getUpdates', 'offset limit timeout allowed_updates', result=tg_obj.Update)
+
+    async def get_updates(
             self,
-            chat_id,
-            photo,
-            message_thread_id=None,
-            caption=None,
-            parse_mode=None,
-            caption_entities=None,
-            has_spoiler=None,
-            disable_notification=None,
-            protect_content=None,
-            reply_to_message_id=None,
-            allow_sending_without_reply=None,
-            reply_markup=None
+            offset=None,
+            limit=None,
+            timeout=None,
+            allowed_updates=None,
+            lazy=False
     ):
-        """Use this method to send photos. On success, the sent Message is returned
+        """Use this method to receive incoming updates using long polling.
 
         Args:
-            See here: https://core.telegram.org/bots/api#sendphoto
+            See here: https://core.telegram.org/bots/api#getupdates
+            lazy (bool): return LazyUpdate views instead of Update instances
         Returns:
-            On success, the sent message is returned as a Message instance
+            List of Update or LazyUpdate instances
         """
 
-        params = await self.__clean_params(locals())
-        url = self.url_start + 'sendPhoto'
-        response = await self.session.get(url, params=params, follow_redirects=True)
-        await self.__tg_raise_for_status(response)
-        res = response.json().get('result')
-        return tg_obj.Message.parse_obj(res)
-
-    async def send_document(
-            self,
-            chat_id,
-            document,
-            message_thread_id=None,
-            thumbnail=None,
-            caption=None,
-            parse_mode=None,
-            caption_entities=None,
-            disable_content_type_detection=None,
-            disable_notification=None,
-            protect_content=None,
-            reply_to_message_id=None,
-            allow_sending_without_reply=None,
-            reply_markup=None
-    ):
-        """Use this method to send general files.
-        On success, the sent Message is returned. Bots can currently send files
-        of any type of up to 50 MB in size, this limit may be changed in the future.
+        params = Bot.__get_updates.get_params((offset, limit, timeout, allowed_updates), {})
+        # The read timeout must outlast the long polling timeout of the server
+        session_timeout = self.session.timeout
+        request_timeout = httpx.Timeout(
+            connect=session_timeout.connect,
+            read=session_timeout.read and session_timeout.read + (timeout or 0),
+            write=session_timeout.write,
+            pool=session_timeout.pool
+        )
+        return await self.call_api(
+            Bot.__get_updates,
+            params,
+            result=tg_obj.LazyUpdate if lazy else tg_obj.Update,
+            timeout=request_timeout
+        )
+
+    def broadcast(self, chat_ids, concurrency=30, **message_kwargs):
+        """Send the same message to many chats concurrently.
+
+        reply_markup is serialized once for all chats.
 
         Args:
-            See here: https://core.telegram.org/bots/api#senddocument
+            chat_ids: iterable of chat ids
+            concurrency (int): max number of requests in flight
+            message_kwargs: arguments of `send_message` except chat_id
         Returns:
-            On success, the sent message is returned as a Message instance
+            Broadcast instance, an asynchronous iterator of BroadcastResult
         """
 
-        params = await self.__clean_params(locals())
-        url = self.url_start + 'sendDocument'
-        response = await self.session.get(url, params=params, follow_redirects=True)
-        await self.__tg_raise_for_status(response)
-        res = response.json().get('result')
-        return tg_obj.Message.parse_obj(res)
+        reply_markup = message_kwargs.get('reply_markup')
+        if reply_markup and not isinstance(reply_markup, (tg_obj.FrozenMarkup, str, bytes)):
+            message_kwargs['reply_markup'] = tg_obj.dumps(reply_markup)
 
-    async def answer_callback_query(
-            self,
-            callback_query_id,
-            text=None,
-            show_alert=None,
-            url=None,
-            cache_time=None
-    ):
-        """Use this method to send answers to callback queries sent from inline keyboards.
-        The answer will be displayed to the user as a notification at the top of the chat
-        screen or as an alert. On success, True is returned.
+        async def send(chat_id):
+            return await self.send_message(chat_id, **message_kwargs)
+
+        return Broadcast(send, chat_ids, concurrency)
+
+    async def call_api(self, method, params=None, result=None, **request_kwargs):
+        """Call the method of the bot api.
 
         Args:
-            See here: https://core.telegram.org/bots/api#answercallbackquery
+            method: ApiMethod instance or name of the method, e.g. 'getMe'
+            params (dict): parameters of the request without None values
+            result: model class of the result, by default the one of the ApiMethod
+            request_kwargs: additional arguments of `httpx.AsyncClient.request`
         Returns:
-            On success, True is returned
+            The result of the method
         """
 
-        params = await self.__clean_params(locals())
-        request_url = self.url_start + 'answerCallbackQuery'
-        response = await self.session.get(request_url, params=params, follow_redirects=True)
+        if isinstance(method, str):
+            method = self.api_methods.get(method) or ApiMethod(method)
+        if self.coalescer is not None and method.name == 'sendMessage' and params:
+            if self.coalescer.can_merge(params):
+                return await self.coalescer.send_message(params)
+            # Messages merged before this one must be sent before it
+            await self.coalescer.drain(params.get('chat_id'))
+        if params and self.file_id_cache is not None and method.file_params.intersection(params):
+            return await self.__call_with_file_ids(method, params, result, **request_kwargs)
+        return await self.__call(method, params, result, **request_kwargs)
+
+    async def __send_merged_message(self, params):
+        return await self.__call(Bot.send_message, params, None)
+
+    async def __call(self, method, params, result, **request_kwargs):
+        """Send the request of the method and get its result, see `call_api`"""
+
+        if self.metrics is None:
+            return await self.__request(method, params, result, **request_kwargs)
+        start = time.perf_counter()
+        try:
+            res = await self.__request(method, params, result, **request_kwargs)
+        except Exception:
+            self.metrics.on_call(method.name, time.perf_counter() - start, failed=True)
+            raise
+        self.metrics.on_call(method.name, time.perf_counter() - start)
+        return res
+
+    async def __request(self, method, params, result, **request_kwargs):
+        chat_id = None
+        if params:
+            chat_id = params.get('chat_id')
+            request_kwargs['content'], request_kwargs['headers'] = method.build_body(params)
+        url = self.urls.get(method.name) or self.url_start + method.name
+        # The long polling of getUpdates takes up to `timeout` seconds on top of the deadline
+        poll_timeout = float(params.get('timeout') or 0) if params and method.name == 'getUpdates' else 0
+        response = await self.__send(method, url, chat_id, poll_timeout, **request_kwargs)
         await self.__tg_raise_for_status(response)
-        return response.json()
+        return self.__parse_result(response, result or method.result, method.name)
+
+    async def __call_with_file_ids(self, method, params, result, **request_kwargs):
+        """Call the method sending known media by file_id and remembering file_id of new media"""
+
+        cache = self.file_id_cache
+        keys = {}
+        for name in method.file_params.intersection(params):
+            key = await cache.get_key(params[name], name)
+            if key is not None:
+                keys[name] = key
+        cached = {}
+        for name, key in keys.items():
+            file_id = cache.get(key)
+            if file_id is None:
+                # The same file may be being uploaded for another chat right now
+                file_id = await cache.wait_upload(key)
+            if file_id is not None:
+                cached[name] = file_id
+
+        if cached:
+            try:
+                return await self.__call(method, {**params, **cached}, result, **request_kwargs)
+            except tg_obj.TgHTTPStatusError as error:
+                # The file_id may be expired, then the media is sent as given
+                if error.response.status_code != 400 or 'file' not in error.response.text:
+                    raise
+                for name in cached:
+                    cache.discard(keys[name])
+
+        uploads = {}
+        for name, key in keys.items():
+            upload = cache.start_upload(key)
+            if upload is not None:
+                uploads[name] = upload
+        try:
+            res = await self.__call(method, params, result, **request_kwargs)
+        except BaseException:
+            # Waiting senders get None and upload the file themselves
+            for upload in uploads.values():
+                upload.set_result(None)
+            raise
+        for name, key in keys.items():
+            file_id = get_file_id(res, name)
+            if file_id is not None:
+                cache.set(key, file_id)
+            if name in uploads:
+                uploads[name].set_result(file_id)
+        return res
+
+    async def __send(self, method, url, chat_id, poll_timeout=0, **request_kwargs):
+        """Send a request to the bot api, repeating it according to the retry policy.
 
-    async def edit_message_reply_markup(
-            self,
-            chat_id=None,
-            message_id=None,
-            inline_message_id=None,
-            reply_markup=None
-    ):
-        """Use this method to edit only the reply markup of messages.
+        Args:
+            method: ApiMethod instance
+            url (str): url of the bot api method
+            chat_id: chat of the request for the rate limiter, None if there is no chat
+            poll_timeout (float): long polling timeout added to the deadline of the retry policy
+            request_kwargs: additional arguments of `httpx.AsyncClient.request`
+        Returns:
+            httpx._models.Response instance of the last attempt
+        Raises:
+            httpx.TimeoutException: if the deadline of the retry policy is exceeded
+        """
+
+        if self.retry_policy is None:
+            return await self.__send_once(method, url, chat_id, **request_kwargs)
+
+        loop = asyncio.get_running_loop()
+        deadline = self.retry_policy.deadline
+        if deadline is not None:
+            deadline += loop.time() + poll_timeout
+        attempt = 0
+        while True:
+            attempt += 1
+            remaining = None if deadline is None else deadline - loop.time()
+            response = None
+            try:
+                response = await asyncio.wait_for(
+                    self.__send_once(method, url, chat_id, **request_kwargs),
+                    remaining
+                )
+            except asyncio.TimeoutError:
+                raise httpx.TimeoutException(
+                    f'Deadline of {self.retry_policy.deadline} s for {method.name} exceeded'
+                ) from None
+            except httpx.TransportError:
+                delay = self.retry_policy.get_delay(attempt)
+                if delay is None or deadline is not None and loop.time() + delay >= deadline:
+                    raise
+            else:
+                if response.is_success:
+                    return response
+                delay = self.retry_policy.get_delay(attempt, response)
+                if delay is None or deadline is not None and loop.time() + delay >= deadline:
+                    return response
+            await asyncio.sleep(delay)
+
+    async def __send_once(self, method, url, chat_id, **request_kwargs):
+        """Send a request to the bot api, waiting for the rate limiter if it is set.
 
         Args:
-            See here: https://core.telegram.org/bots/api#editmessagereplymarkup
-        Return:
-            On success, if the edited message is not an inline message,
-            the edited Message is returned, otherwise True is returned.
+            method: ApiMethod instance
+            url (str): url of the bot api method
+            chat_id: chat of the request for the rate limiter, None if there is no chat
+            request_kwargs: additional arguments of `httpx.AsyncClient.request`
+        Returns:
+            httpx._models.Response instance
         """
 
-        params = await self.__clean_params(locals())
-        url = self.url_start + 'editMessageReplyMarkup'
-        response = await self.session.get(url, params=params, follow_redirects=True)
-        await self.__tg_raise_for_status(response)
-        res = response.json().get('result')
-        return tg_obj.MessageReplyMarkup.parse_obj(res)
+        metrics = self.metrics
+        if metrics is None:
+            if self.rate_limiter:
+                await self.rate_limiter.wait(chat_id)
+            return await self.session.request(method.http_method, url, follow_redirects=True, **request_kwargs)
+
+        if self.rate_limiter:
+            start = time.perf_counter()
+            await self.rate_limiter.wait(chat_id)
+            metrics.observe(method.name, 'rate_limit_wait', time.perf_counter() - start)
+        start = time.perf_counter()
+        try:
+            response = await self.session.request(method.http_method, url, follow_redirects=True, **request_kwargs)
+        except httpx.TransportError:
+            metrics.on_transport_error(method.name, time.perf_counter() - start)
+            raise
+        # Chunked multipart bodies have no Content-Length, the stream counts its bytes itself
+        sent = getattr(request_kwargs.get('content'), 'sent', None)
+        metrics.on_response(method.name, response, time.perf_counter() - start, sent)
+        return response
+
+    def __parse_result(self, response, model, method_name):
+        """Get the result of the successful response as the model instance or list of them.
 
-    async def send_location(self):
-        pass
+        Args:
+            response: httpx._models.Response instance
+            model: class of the result model, None to return the result as is
+            method_name (str): name of the method for the metrics
+        Returns:
+            model instance, list of model instances or the result as is if it is not an object
+        """
+
+        if self.metrics is None:
+            return self.__build_result(self.__decode_result(response), model)
+        start = time.perf_counter()
+        res = self.__decode_result(response)
+        decoded = time.perf_counter()
+        res = self.__build_result(res, model)
+        self.metrics.observe(method_name, 'decode', decoded - start)
+        self.metrics.observe(method_name, 'parse', time.perf_counter() - decoded)
+        return res
+
+    def __decode_result(self, response):
+        if self.trusted:
+            return tg_obj.loads(response.content).get('result')
+        return response.json().get('result')
+
+    def __build_result(self, res, model):
+        if model is None:
+            return res
+        build = model.build_trusted if self.trusted else model.parse_obj
+        if isinstance(res, list):
+            return [build(obj) if isinstance(obj, dict) else obj for obj in res]
+        if isinstance(res, dict):
+            return build(res)
+        return res
 
     @staticmethod
     async def __tg_raise_for_status(response: httpx._models.Response):
@@ -241,18 +657,5 @@ class Bot:
         message = message.format(response, error_type=error_type)
         raise tg_obj.TgHTTPStatusError(message, request=request, response=response)
 
-    @staticmethod
-    async def __clean_params(initial_params):
-        """Getting clean parameters for a request.
-
-        Args:
-            initial_params (dict): initial parameters from functions arguments
-        Returns:
-            Clean parameters for request as dict
-        """
 
-        params = {key: value for key, value in initial_params.items() if value is not None}
-        del params['self']
-        if params.get('reply_markup'):
-            params['reply_markup'] = params['reply_markup'].json()
-        return params
+Bot.api_methods = {method.name: method for method in vars(Bot).values() if isinstance(method, ApiMethod)}
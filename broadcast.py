@@ -0,0 +1,87 @@
+import asyncio
+import time
+
+from typing import Any, NamedTuple, Optional
+
+
+class BroadcastResult(NamedTuple):
+    """Result of sending a message to one chat of the broadcast"""
+
+    chat_id: Any
+    message: Optional[Any] = None
+    error: Optional[Exception] = None
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+class Broadcast:
+    """Asynchronous iterator over the results of sending a message to many chats.
+
+    Sending starts with the iteration. Results are yielded in order of completion.
+    After the iteration `sent`, `failed`, `elapsed` and `throughput` contain the totals.
+
+    Args:
+        send: coroutine function sending the message to one chat_id
+        chat_ids: iterable of chat ids
+        concurrency (int): max number of requests in flight
+    """
+
+    def __init__(self, send, chat_ids, concurrency=30):
+        self.send = send
+        self.chat_ids = chat_ids
+        self.concurrency = concurrency
+        self.sent = 0
+        self.failed = 0
+        self.elapsed = 0.0
+
+    @property
+    def throughput(self):
+        """Processed chats per second"""
+        if not self.elapsed:
+            return 0.0
+        return (self.sent + self.failed) / self.elapsed
+
+    def __str__(self):
+        return (
+            f'Broadcast: {self.sent} sent, {self.failed} failed '
+            f'in {self.elapsed:.2f} s ({self.throughput:.1f} msg/s)'
+        )
+
+    async def __aiter__(self):
+        chat_ids = iter(self.chat_ids)
+        results = asyncio.Queue(maxsize=self.concurrency)
+
+        async def worker():
+            # All workers take chat ids from the same iterator
+            for chat_id in chat_ids:
+                try:
+                    result = BroadcastResult(chat_id, message=await self.send(chat_id))
+                except Exception as error:
+                    result = BroadcastResult(chat_id, error=error)
+                await results.put(result)
+
+        async def run_workers():
+            try:
+                await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                await results.put(None)
+                raise
+            await results.put(None)
+
+        start = time.monotonic()
+        runner = asyncio.create_task(run_workers())
+        try:
+            while (result := await results.get()) is not None:
+                if result.ok:
+                    self.sent += 1
+                else:
+                    self.failed += 1
+                yield result
+            await runner
+        finally:
+            runner.cancel()
+            self.elapsed = time.monotonic() - start
@@ -0,0 +1,126 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+CHAT_FIELDS = ('message', 'edited_message', 'edited_channel_post', 'my_chat_member', 'chat_member', 'chat_join_request')
+USER_FIELDS = ('callback_query', 'inline_query', 'chosen_inline_result', 'shipping_query', 'pre_checkout_query')
+
+
+def get_chat_id(update):
+    """Get the id of the chat or user the update belongs to.
+
+    Args:
+        update: Update instance
+    Returns:
+        id of the chat, id of the user for queries or None for updates without them (e.g. poll)
+    """
+
+    for field in CHAT_FIELDS:
+        obj = getattr(update, field, None)
+        if obj is not None:
+            return obj.chat.id
+    for field in USER_FIELDS:
+        obj = getattr(update, field, None)
+        if obj is not None:
+            return obj.from_.id
+    poll_answer = getattr(update, 'poll_answer', None)
+    if poll_answer is not None:
+        return poll_answer.user.id
+    return None
+
+
+class Dispatcher:
+    """Handler of updates keeping the order of updates within one chat.
+
+    Updates of one chat are handled one after another by the worker of this chat,
+    updates of different chats are handled in parallel. The worker is stopped
+    after `idle_timeout` seconds without updates. Updates without a chat are
+    handled in parallel as they come.
+    The instance is a coroutine function taking one Update, so it can be passed
+    as the handler to `Poller` or `WebhookApp`. The call returns a future done
+    when the update is handled, `Poller` waits for it before saving the offset.
+
+    Args:
+        handler: coroutine function taking one Update instance
+        idle_timeout (float): seconds after which the worker of an idle chat is stopped
+        max_pending (int): max number of updates waiting or being handled,
+            after that the call waits until an update is handled
+        key: function getting the shard key from the update
+    """
+
+    def __init__(self, handler, idle_timeout=10, max_pending=10000, key=get_chat_id):
+        self.handler = handler
+        self.idle_timeout = idle_timeout
+        self.key = key
+        self.pending = asyncio.Semaphore(max_pending)
+        self.shards = {}
+        self.tasks = set()
+        # Handlers of updates without a chat, waited for on close
+        self.handler_tasks = set()
+
+    async def __call__(self, update):
+        """Put the update in the queue of its chat, returns before the update is handled.
+
+        Returns:
+            asyncio.Future done when the update is handled, also if the handler failed
+        """
+
+        await self.pending.acquire()
+        done = asyncio.get_running_loop().create_future()
+        key = self.key(update)
+        if key is None:
+            task = self.__run(self.__handle(update, done))
+            self.handler_tasks.add(task)
+            task.add_done_callback(self.handler_tasks.discard)
+            return done
+        queue = self.shards.get(key)
+        if queue is None:
+            queue = self.shards[key] = asyncio.Queue()
+            self.__run(self.__shard_worker(key, queue))
+        queue.put_nowait((update, done))
+        return done
+
+    async def close(self):
+        """Wait for all updates to be handled and stop the workers"""
+
+        for queue in list(self.shards.values()):
+            await queue.join()
+        if self.handler_tasks:
+            await asyncio.gather(*self.handler_tasks, return_exceptions=True)
+        # Only the idle shard workers are left, waiting for the next update
+        workers = [task for task in self.tasks if task not in self.handler_tasks]
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        self.shards.clear()
+
+    def __run(self, coro):
+        task = asyncio.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    async def __shard_worker(self, key, queue):
+        while True:
+            try:
+                update, done = await asyncio.wait_for(queue.get(), self.idle_timeout)
+            except asyncio.TimeoutError:
+                if queue.empty():
+                    del self.shards[key]
+                    return
+                continue
+            try:
+                await self.__handle(update, done)
+            finally:
+                queue.task_done()
+
+    async def __handle(self, update, done):
+        try:
+            await self.handler(update)
+        except Exception:
+            logger.exception('Failed to handle update %s', update.update_id)
+        finally:
+            self.pending.release()
+            if not done.done():
+                done.set_result(None)
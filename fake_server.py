@@ -0,0 +1,584 @@
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import time
+from collections import OrderedDict, deque
+from http import HTTPStatus
+from typing import NamedTuple
+from urllib.parse import parse_qsl, unquote
+
+from rate_limiter import TokenBucket, is_group
+
+BOT_USER = {'id': 1000000001, 'is_bot': True, 'first_name': 'Fake bot', 'username': 'fake_bot'}
+MAX_MESSAGE_LENGTH = 4096
+MAX_CAPTION_LENGTH = 1024
+# Requests are counted as arriving this much later, so a client pacing at exactly the limit is not refused for jitter
+LEEWAY = 0.1
+
+
+class Upload(NamedTuple):
+    """File uploaded with multipart/form-data"""
+
+    filename: str
+    content_type: str
+    size: int
+
+
+class FakeBotApiError(Exception):
+    """Error response of the fake bot api"""
+
+    def __init__(self, error_code, description, retry_after=None):
+        super().__init__(description)
+        self.error_code = error_code
+        self.description = description
+        self.retry_after = retry_after
+
+    def json(self):
+        data = {'ok': False, 'error_code': self.error_code, 'description': self.description}
+        if self.retry_after is not None:
+            data['parameters'] = {'retry_after': self.retry_after}
+        return data
+
+
+class FakeBotApi:
+    """ASGI application imitating the bot api for load tests without Telegram.
+
+    Sending and editing methods are limited per chat and for the whole bot like Telegram does:
+    a request over the limit gets the error 429 with `retry_after`. getUpdates returns
+    synthetic updates generated at `update_rate` per second and the ones added by `push_update`.
+    Use it with `httpx.ASGITransport(app)` and `Bot(..., base_url='http://fake')`,
+    or serve it on a local port with `serve`.
+
+    Args:
+        token (str): token of the bot, None to accept any token
+        global_rate (float): requests per second for the whole bot
+        chat_rate (float): requests per second for one private chat
+        group_rate (float): requests per second for one group or channel
+        burst (int): number of requests a chat may send without waiting
+        update_rate (float): synthetic updates per second, 0 to generate none
+        chats (int): number of private chats the synthetic updates come from
+        max_updates (int): max number of updates waiting for getUpdates, older ones are dropped
+        max_messages (int): number of sent messages kept for editing
+    """
+
+    def __init__(
+            self,
+            token=None,
+            global_rate=30,
+            chat_rate=1,
+            group_rate=20 / 60,
+            burst=1,
+            update_rate=0,
+            chats=100,
+            max_updates=100000,
+            max_messages=100000
+    ):
+        self.token = token
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.burst = burst
+        self.update_rate = update_rate
+        self.chats = chats
+        self.max_messages = max_messages
+        self.global_rate = global_rate
+        # Times of the requests accepted within the last second, for the limit of the whole bot
+        self.global_window = deque()
+        self.chat_buckets = {}
+        self.messages = OrderedDict()
+        self.message_ids = {}
+        self.updates = deque(maxlen=max_updates)
+        self.last_update_id = 0
+        self.generated = 0
+        self.started = time.monotonic()
+        self.webhook_url = ''
+        self.requests = 0
+        self.limited = 0
+        self.errors = 0
+        self.calls = {}
+        self.methods = {
+            'getMe': self.get_me,
+            'sendMessage': self.send_message,
+            'sendPhoto': self.send_photo,
+            'sendDocument': self.send_document,
+            'answerCallbackQuery': self.answer_callback_query,
+            'editMessageText': self.edit_message_text,
+            'editMessageReplyMarkup': self.edit_message_reply_markup,
+            'setWebhook': self.set_webhook,
+            'deleteWebhook': self.delete_webhook,
+            'getWebhookInfo': self.get_webhook_info,
+            'getUpdates': self.get_updates,
+        }
+        self.__file_ids = itertools.count(1)
+        self.__new_update = None
+
+    def stats(self):
+        """Get the counters of the server.
+
+        Returns:
+            dict with the numbers of requests, errors 429, other errors, updates waiting
+            for getUpdates and the numbers of calls by method
+        """
+
+        return {
+            'requests': self.requests,
+            'limited': self.limited,
+            'errors': self.errors,
+            'pending_updates': len(self.updates),
+            'calls': dict(self.calls),
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                await send({'type': message['type'] + '.complete'})
+                if message['type'] == 'lifespan.shutdown':
+                    return
+        if scope['type'] != 'http':
+            return
+
+        self.requests += 1
+        body = b''
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+        try:
+            result = await self.__handle(scope, body)
+            status, data = 200, {'ok': True, 'result': result}
+        except FakeBotApiError as error:
+            if error.error_code == 429:
+                self.limited += 1
+            else:
+                self.errors += 1
+            status, data = error.error_code, error.json()
+        content = json.dumps(data, ensure_ascii=False).encode()
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(content)).encode())],
+        })
+        await send({'type': 'http.response.body', 'body': content})
+
+    async def __handle(self, scope, body):
+        token, _, method = scope['path'].lstrip('/').partition('/')
+        if not token.startswith('bot') or self.token is not None and token[3:] != self.token:
+            raise FakeBotApiError(401, 'Unauthorized')
+        handler = self.methods.get(method)
+        if handler is None:
+            raise FakeBotApiError(404, 'Not Found')
+        self.calls[method] = self.calls.get(method, 0) + 1
+        return await handler(parse_params(scope, body))
+
+    async def get_me(self, params):
+        return BOT_USER
+
+    async def send_message(self, params):
+        chat_id = self.__chat_id(params)
+        text = params.get('text')
+        if not text:
+            raise FakeBotApiError(400, 'Bad Request: message text is empty')
+        if len(text) > MAX_MESSAGE_LENGTH:
+            raise FakeBotApiError(400, 'Bad Request: message is too long')
+        self.__check_limits(chat_id)
+        return self.__new_message(chat_id, params, text=text)
+
+    async def send_photo(self, params):
+        chat_id = self.__chat_id(params)
+        photo = params.get('photo')
+        if not photo:
+            raise FakeBotApiError(400, 'Bad Request: there is no photo in the request')
+        self.__check_caption(params)
+        self.__check_limits(chat_id)
+        file_id = photo if isinstance(photo, str) else self.__new_file_id('photo')
+        sizes = [
+            {'file_id': f'{file_id}-{width}', 'file_unique_id': f'{file_id}-{width}', 'width': width, 'height': width}
+            for width in (90, 320, 800)
+        ]
+        return self.__new_message(chat_id, params, photo=sizes, caption=params.get('caption'))
+
+    async def send_document(self, params):
+        chat_id = self.__chat_id(params)
+        document = params.get('document')
+        if not document:
+            raise FakeBotApiError(400, 'Bad Request: there is no document in the request')
+        self.__check_caption(params)
+        self.__check_limits(chat_id)
+        if isinstance(document, Upload):
+            file_id = self.__new_file_id('document')
+            document = {
+                'file_id': file_id,
+                'file_unique_id': file_id,
+                'file_name': document.filename,
+                'mime_type': document.content_type,
+                'file_size': document.size,
+            }
+        else:
+            document = {'file_id': document, 'file_unique_id': document}
+        return self.__new_message(chat_id, params, document=document, caption=params.get('caption'))
+
+    async def answer_callback_query(self, params):
+        if not params.get('callback_query_id'):
+            raise FakeBotApiError(400, 'Bad Request: query is too old and response timeout expired or query ID is invalid')
+        return True
+
+    async def edit_message_text(self, params):
+        text = params.get('text')
+        if not text:
+            raise FakeBotApiError(400, 'Bad Request: message text is empty')
+        return self.__edit_message(params, text=text, reply_markup=params.get('reply_markup'))
+
+    async def edit_message_reply_markup(self, params):
+        return self.__edit_message(params, reply_markup=params.get('reply_markup'))
+
+    async def set_webhook(self, params):
+        self.webhook_url = params.get('url') or ''
+        return True
+
+    async def delete_webhook(self, params):
+        self.webhook_url = ''
+        if params.get('drop_pending_updates'):
+            self.updates.clear()
+        return True
+
+    async def get_webhook_info(self, params):
+        self.__generate_updates(time.monotonic())
+        return {'url': self.webhook_url, 'has_custom_certificate': False, 'pending_update_count': len(self.updates)}
+
+    async def get_updates(self, params):
+        if self.webhook_url:
+            raise FakeBotApiError(
+                409, "Conflict: can't use getUpdates method while webhook is active; "
+                     "use deleteWebhook to delete the webhook first"
+            )
+        offset = int(params.get('offset') or 0)
+        limit = min(max(int(params.get('limit') or 100), 1), 100)
+        timeout = float(params.get('timeout') or 0)
+        deadline = time.monotonic() + timeout
+        if self.__new_update is None:
+            self.__new_update = asyncio.Event()
+        while True:
+            now = time.monotonic()
+            self.__generate_updates(now)
+            if offset < 0:
+                while len(self.updates) > -offset:
+                    self.updates.popleft()
+            else:
+                while self.updates and self.updates[0]['update_id'] < offset:
+                    self.updates.popleft()
+            if self.updates or now >= deadline:
+                return list(itertools.islice(self.updates, limit))
+            wait = deadline - now
+            if self.update_rate:
+                wait = min(wait, self.started + (self.generated + 1) / self.update_rate - now)
+            self.__new_update.clear()
+            try:
+                await asyncio.wait_for(self.__new_update.wait(), max(wait, 0))
+            except asyncio.TimeoutError:
+                pass
+
+    def push_update(self, update):
+        """Add the update for getUpdates, update_id is set if it is not given.
+
+        Args:
+            update (dict): json of the update
+        Returns:
+            update_id of the update
+        """
+
+        self.last_update_id = update.setdefault('update_id', self.last_update_id + 1)
+        self.updates.append(update)
+        if self.__new_update is not None:
+            self.__new_update.set()
+        return self.last_update_id
+
+    def make_update(self, number):
+        """Get a synthetic update: a text message, a /start command or a callback query in turn"""
+
+        chat_id = number % self.chats + 1
+        user = {'id': chat_id, 'is_bot': False, 'first_name': f'User {chat_id}', 'language_code': 'en'}
+        chat = {'id': chat_id, 'type': 'private', 'first_name': f'User {chat_id}'}
+        message = {'message_id': self.__next_message_id(chat_id), 'from': user, 'chat': chat, 'date': int(time.time())}
+        kind = number % 3
+        if kind == 0:
+            return {'message': {**message, 'text': f'Message {number}'}}
+        if kind == 1:
+            return {'message': {**message, 'text': '/start', 'entities': [{'type': 'bot_command', 'offset': 0, 'length': 6}]}}
+        message.update({'from': BOT_USER, 'text': 'Menu'})
+        return {'callback_query': {
+            'id': str(number), 'from': user, 'message': message, 'chat_instance': str(chat_id), 'data': f'page:{number}',
+        }}
+
+    def __generate_updates(self, now):
+        if not self.update_rate:
+            return
+        due = int((now - self.started) * self.update_rate) - self.generated
+        if due > self.updates.maxlen:
+            # Updates that would be dropped at once are not generated
+            self.generated += due - self.updates.maxlen
+            self.last_update_id += due - self.updates.maxlen
+            due = self.updates.maxlen
+        for _ in range(due):
+            self.push_update(self.make_update(self.generated))
+            self.generated += 1
+
+    def __check_limits(self, chat_id):
+        now = time.monotonic() + LEEWAY
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            rate = self.group_rate if is_group(chat_id) else self.chat_rate
+            bucket = self.chat_buckets[chat_id] = TokenBucket(rate, self.burst)
+        wait = bucket.take(now)
+        if not wait:
+            wait = self.__take_global(now)
+            if wait:
+                # The request is refused, so the token of the chat is given back
+                bucket.tokens += 1
+        if wait:
+            retry_after = math.ceil(wait)
+            raise FakeBotApiError(429, f'Too Many Requests: retry after {retry_after}', retry_after)
+
+    def __take_global(self, now):
+        """Count the request against the limit of the whole bot, not more than `global_rate`
+        requests in any second, the same as `TokenBucket.take` returns"""
+
+        window = self.global_window
+        # The window is shorter by LEEWAY, as the requests paced at the limit arrive with jitter
+        while window and window[0] <= now - 1 + LEEWAY:
+            window.popleft()
+        if len(window) >= self.global_rate:
+            return window[0] + 1 - LEEWAY - now
+        window.append(now)
+        return 0
+
+    @staticmethod
+    def __check_caption(params):
+        if len(params.get('caption') or '') > MAX_CAPTION_LENGTH:
+            raise FakeBotApiError(400, 'Bad Request: message caption is too long')
+
+    @staticmethod
+    def __chat_id(params):
+        chat_id = params.get('chat_id')
+        if chat_id in (None, ''):
+            raise FakeBotApiError(400, 'Bad Request: chat_id is empty')
+        if isinstance(chat_id, str) and not chat_id.startswith('@'):
+            try:
+                return int(chat_id)
+            except ValueError:
+                raise FakeBotApiError(400, 'Bad Request: chat not found') from None
+        return chat_id
+
+    def __next_message_id(self, chat_id):
+        message_id = self.message_ids[chat_id] = self.message_ids.get(chat_id, 0) + 1
+        return message_id
+
+    def __new_file_id(self, kind):
+        return f'fake-{kind}-{next(self.__file_ids)}'
+
+    def __new_message(self, chat_id, params, **content):
+        if isinstance(chat_id, str):
+            chat = {'id': -1000000000000 - abs(hash(chat_id)) % 10 ** 9, 'type': 'channel', 'username': chat_id[1:]}
+        elif chat_id < 0:
+            chat = {'id': chat_id, 'type': 'supergroup', 'title': f'Group {-chat_id}'}
+        else:
+            chat = {'id': chat_id, 'type': 'private', 'first_name': f'User {chat_id}'}
+        message = {
+            'message_id': self.__next_message_id(chat_id),
+            'from': BOT_USER,
+            'chat': chat,
+            'date': int(time.time()),
+            **{name: value for name, value in content.items() if value is not None},
+        }
+        if params.get('reply_markup'):
+            message['reply_markup'] = params['reply_markup']
+        key = (chat_id, message['message_id'])
+        self.messages[key] = message
+        if len(self.messages) > self.max_messages:
+            self.messages.popitem(last=False)
+        return message
+
+    def __edit_message(self, params, **content):
+        chat_id = self.__chat_id(params)
+        message = self.messages.get((chat_id, int(params.get('message_id') or 0)))
+        if message is None:
+            raise FakeBotApiError(400, 'Bad Request: message to edit not found')
+        if all(message.get(name) == value for name, value in content.items()):
+            raise FakeBotApiError(
+                400, 'Bad Request: message is not modified: specified new message content and reply markup '
+                     'are exactly the same as a current content and reply markup of the message'
+            )
+        self.__check_limits(chat_id)
+        for name, value in content.items():
+            if value is None:
+                message.pop(name, None)
+            else:
+                message[name] = value
+        message['edit_date'] = int(time.time())
+        return message
+
+
+def parse_params(scope, body):
+    """Get the parameters of the request from the query string and the JSON, form or multipart body.
+
+    Values of the form and multipart fields that look like JSON objects or arrays are decoded,
+    uploaded files are given as Upload instances.
+    """
+
+    params = {name: decode_value(value) for name, value in parse_qsl(scope.get('query_string', b'').decode())}
+    content_type = dict(scope['headers']).get(b'content-type', b'').decode('latin-1')
+    if not body:
+        return params
+    if content_type.startswith('application/json'):
+        try:
+            params.update(json.loads(body))
+        except ValueError:
+            raise FakeBotApiError(400, "Bad Request: can't parse JSON") from None
+    elif content_type.startswith('multipart/form-data'):
+        boundary = content_type.partition('boundary=')[2].strip('"').encode()
+        params.update(parse_multipart(body, boundary))
+    elif content_type.startswith('application/x-www-form-urlencoded'):
+        params.update((name, decode_value(value)) for name, value in parse_qsl(body.decode()))
+    return params
+
+
+def parse_multipart(body, boundary):
+    params = {}
+    for part in body.split(b'--' + boundary)[1:]:
+        if part.startswith(b'--'):
+            break
+        # Only the line break after the boundary and the one before the next boundary
+        # belong to the format, the content itself may start or end with them
+        if part.startswith(b'\r\n'):
+            part = part[2:]
+        if part.endswith(b'\r\n'):
+            part = part[:-2]
+        head, _, content = part.partition(b'\r\n\r\n')
+        headers = {}
+        for line in head.decode('utf-8').split('\r\n'):
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        disposition = {}
+        for item in headers.get('content-disposition', '').split(';')[1:]:
+            name, _, value = item.strip().partition('=')
+            disposition[name] = value.strip('"')
+        if 'filename' in disposition:
+            params[disposition['name']] = Upload(
+                disposition['filename'], headers.get('content-type', 'application/octet-stream'), len(content)
+            )
+        else:
+            params[disposition.get('name')] = decode_value(content.decode('utf-8'))
+    return params
+
+
+def decode_value(value):
+    if value[:1] in ('{', '['):
+        try:
+            return json.loads(value)
+        except ValueError:
+            pass
+    return value
+
+
+async def serve(app, host='127.0.0.1', port=8081):
+    """Serve the ASGI application over HTTP/1.1 with keep-alive, enough to point a bot at it in load tests.
+
+    Args:
+        app: ASGI application, e.g. FakeBotApi instance
+        host (str): host to listen on
+        port (int): port to listen on
+    Returns:
+        Started asyncio.Server instance
+    """
+
+    async def handle_connection(reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, version = request_line.decode('latin-1').rstrip('\r\n').split(' ', 2)
+                headers = []
+                while (line := await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers.append((name.strip().lower().encode('latin-1'), value.strip().encode('latin-1')))
+                header_map = dict(headers)
+                if header_map.get(b'transfer-encoding', b'').lower() == b'chunked':
+                    body = await read_chunked(reader)
+                else:
+                    body = await reader.readexactly(int(header_map.get(b'content-length', b'0')))
+
+                path, _, query = target.partition('?')
+                scope = {
+                    'type': 'http',
+                    'asgi': {'version': '3.0'},
+                    'http_version': version.partition('/')[2],
+                    'method': method,
+                    'scheme': 'http',
+                    'path': unquote(path),
+                    'raw_path': path.encode('latin-1'),
+                    'query_string': query.encode('latin-1'),
+                    'headers': headers,
+                    'client': writer.get_extra_info('peername'),
+                    'server': (host, port),
+                }
+                response = {}
+                chunks = []
+
+                async def receive():
+                    return {'type': 'http.request', 'body': body, 'more_body': False}
+
+                async def send(message):
+                    if message['type'] == 'http.response.start':
+                        response.update(message)
+                    elif message['type'] == 'http.response.body':
+                        chunks.append(message.get('body', b''))
+
+                await app(scope, receive, send)
+                content = b''.join(chunks)
+                status = response.get('status', 500)
+                lines = [f'HTTP/1.1 {status} {HTTPStatus(status).phrase}'.encode()]
+                lines += [name + b': ' + value for name, value in response.get('headers', [])
+                          if name.lower() != b'content-length']
+                lines.append(b'content-length: %d' % len(content))
+                writer.write(b'\r\n'.join(lines) + b'\r\n\r\n' + content)
+                await writer.drain()
+                if header_map.get(b'connection', b'').lower() == b'close':
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle_connection, host, port)
+
+
+async def read_chunked(reader):
+    body = b''
+    while size := int((await reader.readline()).split(b';')[0], 16):
+        body += await reader.readexactly(size)
+        await reader.readline()
+    await reader.readline()
+    return body
+
+
+async def main():
+    parser = argparse.ArgumentParser(description='Fake bot api server for load tests')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--token', default=None, help='token of the bot, any token is accepted by default')
+    parser.add_argument('--update-rate', type=float, default=0, help='synthetic updates per second')
+    parser.add_argument('--chats', type=int, default=100, help='number of chats of the synthetic updates')
+    args = parser.parse_args()
+
+    app = FakeBotApi(token=args.token, update_rate=args.update_rate, chats=args.chats)
+    server = await serve(app, args.host, args.port)
+    print(f'Fake bot api is listening on http://{args.host}:{args.port}')
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,188 @@
+import asyncio
+import logging
+import math
+import time
+
+import httpx
+import tg_obj
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS = 6371000
+
+
+def distance(first, second):
+    """Distance in meters between two points on the map.
+
+    Args:
+        first: Location instance
+        second: Location instance
+    Returns:
+        float
+    """
+
+    lat1, lat2 = math.radians(first.latitude), math.radians(second.latitude)
+    d_lat = lat2 - lat1
+    d_lon = math.radians(second.longitude - first.longitude)
+    a = math.sin(d_lat / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(d_lon / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(min(1.0, math.sqrt(a)))
+
+
+def heading_change(first, second):
+    """Change of the heading in degrees from 0 to 180, 0 if some heading is not known"""
+
+    first_heading = getattr(first, 'heading', None)
+    second_heading = getattr(second, 'heading', None)
+    if first_heading is None or second_heading is None:
+        return 0
+    change = abs(first_heading - second_heading) % 360
+    return min(change, 360 - change)
+
+
+class LiveLocation:
+    """Live location message updated from a stream of points.
+
+    Points may be passed to `update` as often as they come from the GPS.
+    Only the latest point is sent, not more often than once in `interval` seconds,
+    and only if it has moved by `min_distance` meters or turned by `min_heading`
+    degrees from the last sent point.
+
+    Args:
+        bot: Bot instance
+        chat_id: chat to send the location to
+        live_period (int): period in seconds for which the location will be updated, 60-86400
+        interval (float): min seconds between edits of the location
+        min_distance (float): min distance in meters from the last sent point to send a new one
+        min_heading (int): min change of the heading in degrees to send a new point
+        send_kwargs: other parameters of sendLocation, e.g. reply_markup
+    """
+
+    def __init__(
+            self,
+            bot,
+            chat_id,
+            live_period=3600,
+            interval=3.0,
+            min_distance=10,
+            min_heading=15,
+            **send_kwargs
+    ):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.live_period = live_period
+        self.interval = interval
+        self.min_distance = min_distance
+        self.min_heading = min_heading
+        self.send_kwargs = send_kwargs
+        self.message = None
+        self.sent_point = None
+        self.sent = 0
+        self.dropped = 0
+        self.ends_at = None
+        self.__point = None
+        self.__new_point = asyncio.Event()
+        self.__task = None
+
+    @property
+    def active(self):
+        return self.__task is not None and not self.__task.done() and time.monotonic() < self.ends_at
+
+    async def start(self, latitude, longitude, horizontal_accuracy=None, heading=None, proximity_alert_radius=None):
+        """Send the live location message with the first point.
+
+        Returns:
+            The sent Message instance
+        """
+
+        point = tg_obj.Location(
+            latitude=latitude,
+            longitude=longitude,
+            horizontal_accuracy=horizontal_accuracy,
+            heading=heading,
+            proximity_alert_radius=proximity_alert_radius,
+        )
+        self.message = await self.bot.send_location(
+            self.chat_id, live_period=self.live_period, **self.__point_params(point), **self.send_kwargs
+        )
+        self.sent_point = point
+        self.ends_at = time.monotonic() + self.live_period
+        self.__task = asyncio.create_task(self.__run())
+        return self.message
+
+    def update(self, latitude, longitude, horizontal_accuracy=None, heading=None, proximity_alert_radius=None):
+        """Pass the new point, replacing the point not yet sent. Values are validated by `tg_obj.Location`"""
+
+        point = tg_obj.Location(
+            latitude=latitude,
+            longitude=longitude,
+            horizontal_accuracy=horizontal_accuracy,
+            heading=heading,
+            proximity_alert_radius=proximity_alert_radius,
+        )
+        if self.__point is not None:
+            self.dropped += 1
+        self.__point = point
+        self.__new_point.set()
+
+    def is_meaningful(self, point):
+        """True if the point differs enough from the last sent one"""
+
+        return (
+            distance(self.sent_point, point) >= self.min_distance
+            or heading_change(self.sent_point, point) >= self.min_heading
+        )
+
+    async def stop(self, reply_markup=None):
+        """Send the last meaningful point and stop updating the location.
+
+        Returns:
+            The edited Message instance or None if the live period has already expired
+        """
+
+        if self.__task is None:
+            return None
+        task, self.__task = self.__task, None
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        if time.monotonic() >= self.ends_at:
+            return None
+        point, self.__point = self.__point, None
+        if point is not None and self.is_meaningful(point):
+            await self.__edit(point)
+        return await self.bot.stop_message_live_location(
+            self.chat_id, self.message.message_id, reply_markup=reply_markup
+        )
+
+    async def __run(self):
+        next_at = time.monotonic() + self.interval
+        while True:
+            await self.__new_point.wait()
+            delay = next_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if time.monotonic() >= self.ends_at:
+                return
+            self.__new_point.clear()
+            point, self.__point = self.__point, None
+            if not self.is_meaningful(point):
+                self.dropped += 1
+                continue
+            next_at = time.monotonic() + self.interval
+            try:
+                await self.__edit(point)
+            except httpx.HTTPError:
+                logger.exception('Failed to edit live location in chat %s', self.chat_id)
+
+    async def __edit(self, point):
+        await self.bot.edit_message_live_location(
+            chat_id=self.chat_id, message_id=self.message.message_id, **self.__point_params(point)
+        )
+        self.sent_point = point
+        self.sent += 1
+
+    @staticmethod
+    def __point_params(point):
+        return {
+            name: getattr(point, name, None)
+            for name in ('latitude', 'longitude', 'horizontal_accuracy', 'heading', 'proximity_alert_radius')
+        }
@@ -0,0 +1,358 @@
+import asyncio
+import hashlib
+import json
+import mimetypes
+import os
+import tg_obj
+
+CHUNK_SIZE = 64 * 1024
+
+
+class InputFile:
+    """File to upload with multipart/form-data, read in chunks while it is sent.
+
+    Plain str values of file parameters are file_id or URL and are not uploaded,
+    so a local path given as str must be wrapped in InputFile.
+
+    Args:
+        source: path (str or os.PathLike), bytes, bytearray or memoryview,
+            binary file object or asynchronous iterable of bytes
+        filename (str): name of the file for Telegram, taken from the source if possible
+        content_type (str): MIME type, guessed from the filename by default
+    """
+
+    def __init__(self, source, filename=None, content_type=None):
+        self.source = source
+        if isinstance(source, (str, os.PathLike)):
+            self.kind = 'path'
+            default_name = os.path.basename(source)
+        elif isinstance(source, (bytes, bytearray, memoryview)):
+            self.kind = 'bytes'
+            default_name = None
+        elif hasattr(source, 'read'):
+            self.kind = 'file'
+            default_name = os.path.basename(getattr(source, 'name', '') or '') or None
+            self.start = source.tell() if source.seekable() else None
+        elif hasattr(source, '__aiter__'):
+            self.kind = 'async'
+            default_name = None
+            self.consumed = False
+        else:
+            raise TypeError(f'Cannot upload {type(source).__name__}')
+        self.filename = filename or default_name or 'file'
+        self.content_type = content_type or mimetypes.guess_type(self.filename)[0] or 'application/octet-stream'
+
+    @property
+    def size(self):
+        """Size in bytes or None if it is not known before reading"""
+
+        if self.kind == 'path':
+            return os.path.getsize(self.source)
+        if self.kind == 'bytes':
+            return memoryview(self.source).nbytes
+        if self.kind == 'file' and self.start is not None:
+            end = self.source.seek(0, os.SEEK_END)
+            self.source.seek(self.start)
+            return end - self.start
+        return None
+
+    async def aiter_bytes(self):
+        """Iterate over the content in chunks, can be repeated unless the source is an async iterable"""
+
+        if self.kind == 'bytes':
+            view = memoryview(self.source).cast('B')
+            for start in range(0, len(view), CHUNK_SIZE):
+                yield view[start:start + CHUNK_SIZE]
+        elif self.kind == 'path':
+            with open(self.source, 'rb') as file:
+                while chunk := await asyncio.to_thread(file.read, CHUNK_SIZE):
+                    yield chunk
+        elif self.kind == 'file':
+            if self.start is not None:
+                self.source.seek(self.start)
+            while chunk := await asyncio.to_thread(self.source.read, CHUNK_SIZE):
+                yield chunk
+        else:
+            if self.consumed:
+                raise tg_obj.TgRuntimeError('The upload from an async iterable cannot be repeated')
+            self.consumed = True
+            async for chunk in self.source:
+                yield chunk
+
+
+def to_input_file(value):
+    """Wrap the value of a file parameter in InputFile if it has to be uploaded.
+
+    Args:
+        value: value of a file parameter
+    Returns:
+        InputFile instance or None if the value is file_id or URL
+    """
+
+    if isinstance(value, InputFile):
+        return value
+    if isinstance(value, str):
+        return None
+    return InputFile(value)
+
+
+def attach_media(items):
+    """Replace files to upload in the items of sendMediaGroup with attach:// links.
+
+    Args:
+        items: list of InputMedia* instances or dicts
+    Returns:
+        (items, files): list of dicts for the media parameter and dict of InputFile instances by field name
+    """
+
+    attached = []
+    files = {}
+    for item in items:
+        item = dict(item if isinstance(item, dict) else item.__dict__)
+        for name in ('media', 'thumbnail'):
+            file = to_input_file(item[name]) if name in item else None
+            if file is not None:
+                field = f'file{len(files)}'
+                files[field] = file
+                item[name] = f'attach://{field}'
+        attached.append(item)
+    return attached, files
+
+
+class MultipartStream:
+    """Body of multipart/form-data request streaming the files chunk by chunk.
+
+    Args:
+        fields (dict): names and encoded values of the plain fields
+        files (dict): names of fields and InputFile instances
+    """
+
+    def __init__(self, fields: dict, files: dict):
+        self.boundary = os.urandom(16).hex().encode()
+        # Bytes yielded by the last iteration, the size of the body sent without Content-Length
+        self.sent = 0
+        self.fields = [
+            (self.__part_headers(name), value) for name, value in fields.items()
+        ]
+        self.files = [
+            (self.__part_headers(name, file), file) for name, file in files.items()
+        ]
+
+    @property
+    def headers(self):
+        headers = {'Content-Type': f'multipart/form-data; boundary={self.boundary.decode()}'}
+        size = self.size
+        if size is not None:
+            headers['Content-Length'] = str(size)
+        return headers
+
+    @property
+    def size(self):
+        """Size of the body in bytes or None if the size of some file is unknown"""
+
+        size = len(self.boundary) + 6
+        for part_headers, value in self.fields:
+            size += len(part_headers) + len(value) + 2
+        for part_headers, file in self.files:
+            file_size = file.size
+            if file_size is None:
+                return None
+            size += len(part_headers) + file_size + 2
+        return size
+
+    async def __aiter__(self):
+        self.sent = 0
+        for part_headers, value in self.fields:
+            part = part_headers + value + b'\r\n'
+            self.sent += len(part)
+            yield part
+        for part_headers, file in self.files:
+            self.sent += len(part_headers)
+            yield part_headers
+            async for chunk in file.aiter_bytes():
+                self.sent += len(chunk)
+                yield bytes(chunk)
+            self.sent += 2
+            yield b'\r\n'
+        end = b'--' + self.boundary + b'--\r\n'
+        self.sent += len(end)
+        yield end
+
+    def __part_headers(self, name, file=None):
+        disposition = f'form-data; name="{name}"'
+        if file is None:
+            return b'--%s\r\nContent-Disposition: %s\r\n\r\n' % (self.boundary, disposition.encode())
+        filename = file.filename.replace('"', '%22')
+        return b'--%s\r\nContent-Disposition: %s; filename="%s"\r\nContent-Type: %s\r\n\r\n' % (
+            self.boundary, disposition.encode(), filename.encode(), file.content_type.encode()
+        )
+
+
+class FileIdCache:
+    """Cache of file_id of sent media, keyed by the hash of the content or by the URL.
+
+    With the cache set on the bot, the file sent once is sent again by its file_id
+    instead of uploading it or making Telegram download it from the URL again.
+    Concurrent sends of the same file wait for the first upload and use its file_id.
+
+    Args:
+        path (str): JSON file to keep the cache between restarts, None to keep it in memory only
+        autosave (bool): save the file after new file_id, at most once in `save_delay` seconds
+            and in a thread when called from the event loop
+        save_delay (float): seconds to collect new file_id before saving the file
+    """
+
+    def __init__(self, path=None, autosave=True, save_delay=1.0):
+        self.path = path
+        self.autosave = autosave
+        self.save_delay = save_delay
+        self.file_ids = {}
+        # key -> future of file_id of the upload in progress
+        self.uploads = {}
+        self.hits = 0
+        self.misses = 0
+        # (path, size, mtime) -> hash, to not read the same local file again
+        self.__path_hashes = {}
+        self.__save_task = None
+        if path and os.path.exists(path):
+            self.load()
+
+    def load(self):
+        with open(self.path, encoding='utf-8') as file:
+            self.file_ids.update(json.load(file))
+
+    def save(self):
+        """Write the cache to the file atomically"""
+        self.__write(dict(self.file_ids))
+
+    async def flush(self):
+        """Wait for the scheduled save of the file, e.g. before exit"""
+        if self.__save_task is not None:
+            await asyncio.gather(self.__save_task, return_exceptions=True)
+
+    def get(self, key):
+        file_id = self.file_ids.get(key)
+        if file_id is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return file_id
+
+    def set(self, key, file_id):
+        if self.file_ids.get(key) == file_id:
+            return
+        self.file_ids[key] = file_id
+        if self.path and self.autosave:
+            self.__schedule_save()
+
+    def discard(self, key):
+        self.file_ids.pop(key, None)
+
+    def start_upload(self, key):
+        """Register the upload of the file with the key.
+
+        Returns:
+            asyncio.Future to set the file_id on (None if the upload failed),
+            None if the file is being uploaded by another call already
+        """
+
+        if key in self.uploads:
+            return None
+        future = self.uploads[key] = asyncio.get_running_loop().create_future()
+        future.add_done_callback(lambda _: self.uploads.get(key) is future and self.uploads.pop(key))
+        return future
+
+    async def wait_upload(self, key):
+        """Wait for the upload of the file with the key in progress.
+
+        Returns:
+            file_id or None if there is no upload in progress or it failed
+        """
+
+        future = self.uploads.get(key)
+        if future is None:
+            return None
+        return await asyncio.shield(future)
+
+    def __schedule_save(self):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            self.save()
+            return
+        if self.__save_task is None or self.__save_task.done():
+            self.__save_task = asyncio.create_task(self.__save_later())
+
+    async def __save_later(self):
+        await asyncio.sleep(self.save_delay)
+        await asyncio.to_thread(self.__write, dict(self.file_ids))
+
+    def __write(self, file_ids):
+        temp_path = f'{self.path}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(file_ids, file)
+        os.replace(temp_path, self.path)
+
+    async def get_key(self, value, name):
+        """Get the key of the value of a file parameter.
+
+        The key includes the name of the parameter, as file_id of a photo cannot be sent as a document.
+
+        Args:
+            value: URL, file_id or a file to upload
+            name (str): name of the file parameter, e.g. 'photo'
+        Returns:
+            '<name>:url:<URL>' or '<name>:sha256:<hash>' or None if the value is file_id or cannot be read twice
+        """
+
+        if isinstance(value, str):
+            return f'{name}:url:{value}' if value.startswith(('http://', 'https://')) else None
+        file = to_input_file(value)
+        if file.kind == 'bytes':
+            # Large content is hashed in a thread to not block the event loop
+            if len(file.source) > CHUNK_SIZE:
+                return f'{name}:' + await asyncio.to_thread(self.__hash_file, file)
+            return f'{name}:' + self.__hash_file(file)
+        if file.kind == 'path':
+            stat = os.stat(file.source)
+            path_key = (os.path.realpath(file.source), stat.st_size, stat.st_mtime_ns)
+            if path_key not in self.__path_hashes:
+                self.__path_hashes[path_key] = await asyncio.to_thread(self.__hash_file, file)
+            return f'{name}:' + self.__path_hashes[path_key]
+        if file.kind == 'file' and file.start is not None:
+            return f'{name}:' + await asyncio.to_thread(self.__hash_file, file)
+        return None
+
+    @staticmethod
+    def __hash_file(file):
+        if file.kind == 'bytes':
+            return 'sha256:' + hashlib.sha256(file.source).hexdigest()
+        digest = hashlib.sha256()
+        if file.kind == 'path':
+            with open(file.source, 'rb') as source:
+                while chunk := source.read(CHUNK_SIZE):
+                    digest.update(chunk)
+        else:
+            file.source.seek(file.start)
+            while chunk := file.source.read(CHUNK_SIZE):
+                digest.update(chunk)
+            file.source.seek(file.start)
+        return 'sha256:' + digest.hexdigest()
+
+
+def get_file_id(message, name):
+    """Get file_id of the media sent in the message.
+
+    Args:
+        message: Message instance returned by the send method
+        name (str): name of the file parameter, e.g. 'photo'
+    Returns:
+        file_id of the largest photo size or of the file, None if there is no such media
+    """
+
+    media = getattr(message, name, None)
+    if isinstance(media, list):
+        media = media[-1] if media else None
+    if isinstance(media, dict):
+        return media.get('file_id')
+    return None
@@ -0,0 +1,183 @@
+from media import MultipartStream, attach_media, to_input_file
+from tg_obj import FrozenMarkup, dumps
+
+JSON_HEADERS = {'Content-Type': 'application/json'}
+
+# Parameters passed to the bot api as JSON-serialized objects
+JSON_PARAMS = frozenset((
+    'reply_markup',
+    'entities',
+    'caption_entities',
+    'allowed_updates',
+    'media',
+    'explanation_entities',
+))
+
+# Parameters that can be uploaded as files
+FILE_PARAMS = frozenset((
+    'photo',
+    'document',
+    'thumbnail',
+    'certificate',
+    'audio',
+    'video',
+    'animation',
+    'voice',
+    'video_note',
+    'sticker',
+))
+
+
+class ApiMethod:
+    """Declaration of the bot api method, as a Bot attribute it is the coroutine function calling the method.
+
+    The call takes the parameters positionally in the declared order or by name,
+    None values are dropped. Parameters are sent as the JSON body of the POST request,
+    or as multipart/form-data if some file parameter has to be uploaded (see `media.InputFile`).
+    The url and the sets of JSON and file parameters are computed once.
+
+    Args:
+        name (str): name of the method in the bot api, e.g. 'sendMessage'
+        params (str): names of the parameters separated by spaces, the required ones first
+        required (int): number of the required parameters
+        result: model class of the result, None to return the result as is (True, str, int)
+        http_method (str): http method of the request
+        doc (str): docstring of the method
+    """
+
+    def __init__(self, name, params='', required=0, result=None, http_method='POST', doc=None):
+        self.name = name
+        self.params = tuple(params.split())
+        self.param_set = frozenset(self.params)
+        self.required = self.params[:required]
+        self.result = result
+        self.http_method = http_method
+        self.json_params = self.param_set & JSON_PARAMS if self.params else JSON_PARAMS
+        self.file_params = self.param_set & FILE_PARAMS if self.params else FILE_PARAMS
+        self.attr = name
+        self.__doc__ = doc
+
+    def __repr__(self):
+        return f'ApiMethod({self.name!r})'
+
+    def __set_name__(self, owner, attr):
+        self.attr = attr
+
+    def __get__(self, bot, owner=None):
+        if bot is None:
+            return self
+
+        async def call(*args, **kwargs):
+            return await bot.call_api(self, self.get_params(args, kwargs))
+
+        call.__name__ = self.attr
+        call.__doc__ = self.__doc__
+        # ApiMethod is a non-data descriptor, so later lookups find the bound call in the instance dict
+        bot.__dict__[self.attr] = call
+        return call
+
+    def get_params(self, args, kwargs):
+        """Get the parameters of the request from arguments of the call.
+
+        Args:
+            args (tuple): positional arguments in the declared order
+            kwargs (dict): keyword arguments
+        Returns:
+            dict of parameters without None values
+        """
+
+        if len(args) > len(self.params):
+            raise TypeError(f'{self.attr}() takes {len(self.params)} positional arguments but {len(args)} were given')
+        params = {name: value for name, value in zip(self.params, args) if value is not None}
+        for name, value in kwargs.items():
+            if name not in self.param_set:
+                raise TypeError(f'{self.attr}() got an unexpected keyword argument {name!r}')
+            if value is not None:
+                params[name] = value
+        for name in self.required:
+            if name not in params:
+                raise TypeError(f'{self.attr}() missing required argument {name!r}')
+        return params
+
+    def build_body(self, params):
+        """Get the body of the request and its headers.
+
+        Args:
+            params (dict): parameters of the request
+        Returns:
+            (content, headers): JSON as bytes or MultipartStream if there are files to upload
+        """
+
+        files = {}
+        for name in self.file_params.intersection(params):
+            file = to_input_file(params[name])
+            if file is not None:
+                files[name] = file
+        if isinstance(params.get('media'), list):
+            media, media_files = attach_media(params['media'])
+            if media_files:
+                params = {**params, 'media': media}
+                files.update(media_files)
+        if not files:
+            return self.encode(params), JSON_HEADERS
+        fields = {
+            name: self.encode_field(name, value) for name, value in params.items() if name not in files
+        }
+        stream = MultipartStream(fields, files)
+        return stream, stream.headers
+
+    def encode(self, params):
+        """Encode the parameters as the JSON body of the request.
+
+        Frozen keyboards and JSON parameters passed as str or bytes are inserted
+        as they are, without decoding and encoding them again.
+
+        Args:
+            params (dict): parameters of the request
+        Returns:
+            JSON as bytes
+        """
+
+        ready = {}
+        for name in self.json_params.intersection(params):
+            value = params[name]
+            if isinstance(value, (FrozenMarkup, str, bytes)):
+                ready[name] = encode_json_param(value)
+        if not ready:
+            return dumps(params)
+        parts = [dumps({name: value for name, value in params.items() if name not in ready})[:-1]]
+        for name, value in ready.items():
+            parts.append(b'"%s":%s' % (name.encode(), value))
+        return parts[0] + (b',' if len(parts[0]) > 1 else b'') + b','.join(parts[1:]) + b'}'
+
+    def encode_field(self, name, value):
+        """Encode the parameter as the field of multipart/form-data.
+
+        Args:
+            name (str): name of the parameter
+            value: value of the parameter
+        Returns:
+            bytes
+        """
+
+        if name in self.json_params:
+            return encode_json_param(value)
+        if isinstance(value, str):
+            return value.encode()
+        if isinstance(value, bool):
+            return b'true' if value else b'false'
+        if isinstance(value, (int, float)):
+            return str(value).encode()
+        return dumps(value)
+
+
+def encode_json_param(value):
+    """Encode the JSON parameter, str and bytes are taken as already encoded JSON"""
+
+    if isinstance(value, FrozenMarkup):
+        return value.json_bytes
+    if isinstance(value, str):
+        return value.encode()
+    if isinstance(value, bytes):
+        return value
+    return dumps(value)
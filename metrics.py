@@ -0,0 +1,212 @@
+from bisect import bisect_left
+
+# Upper bounds of the latency buckets in seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Stages of the call measured separately
+STAGES = ('call', 'rate_limit_wait', 'network', 'decode', 'parse')
+
+
+class Histogram:
+    """Histogram of values with fixed bucket bounds, as in Prometheus."""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        # The last count is of the values above all bounds
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else 0.0
+
+    def quantile(self, q):
+        """Upper bound of the bucket containing the q-quantile, inf if it is above all bounds"""
+
+        rank = q * self.count
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            if total >= rank:
+                return bound
+        return float('inf')
+
+
+class MethodMetrics:
+    """Counters and histograms of one bot api method."""
+
+    __slots__ = (
+        'calls', 'failed', 'attempts', 'statuses', 'rate_limited', 'transport_errors',
+        'bytes_sent', 'bytes_received', 'histograms',
+    )
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.calls = 0
+        self.failed = 0
+        self.attempts = 0
+        self.statuses = {}
+        self.rate_limited = 0
+        self.transport_errors = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.histograms = {stage: Histogram(buckets) for stage in STAGES}
+
+    def as_dict(self):
+        return {
+            'calls': self.calls,
+            'failed': self.failed,
+            'attempts': self.attempts,
+            'statuses': dict(self.statuses),
+            'rate_limited': self.rate_limited,
+            'transport_errors': self.transport_errors,
+            'bytes_sent': self.bytes_sent,
+            'bytes_received': self.bytes_received,
+            **{
+                f'{stage}_seconds': {
+                    'count': histogram.count,
+                    'mean': histogram.mean,
+                    'p50': histogram.quantile(0.5),
+                    'p99': histogram.quantile(0.99),
+                }
+                for stage, histogram in self.histograms.items()
+            },
+        }
+
+
+class Metrics:
+    """Instrumentation of the bot api calls by method, set on the bot with `Bot(..., metrics=Metrics())`.
+
+    The bot reports the whole call, the wait for the rate limiter, the network time of each attempt
+    (including the time Telegram takes to answer), decoding of the JSON and building of the models.
+    Each observation is also passed to `callback` to send it elsewhere, e.g. to statsd.
+
+    Args:
+        buckets (tuple): upper bounds of the latency buckets in seconds
+        callback: function taking the method name, the name of the value and the value,
+            e.g. ('sendMessage', 'network_seconds', 0.12) or ('sendMessage', 'status', 429)
+        prefix (str): prefix of the names of Prometheus metrics
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, callback=None, prefix='tg_bot'):
+        self.buckets = tuple(buckets)
+        self.callback = callback
+        self.prefix = prefix
+        self.methods = {}
+
+    def get(self, method):
+        """Get MethodMetrics of the method by its name"""
+
+        metrics = self.methods.get(method)
+        if metrics is None:
+            metrics = self.methods[method] = MethodMetrics(self.buckets)
+        return metrics
+
+    def observe(self, method, stage, seconds):
+        """Add the duration of the stage of the call, see `STAGES`"""
+
+        self.get(method).histograms[stage].observe(seconds)
+        if self.callback is not None:
+            self.callback(method, f'{stage}_seconds', seconds)
+
+    def on_call(self, method, seconds, failed=False):
+        metrics = self.get(method)
+        metrics.calls += 1
+        if failed:
+            metrics.failed += 1
+        self.observe(method, 'call', seconds)
+        if failed and self.callback is not None:
+            self.callback(method, 'failed', 1)
+
+    def on_response(self, method, response, seconds, sent=None):
+        """Count the response of one attempt.
+
+        Args:
+            method (str): name of the method
+            response: httpx.Response instance
+            seconds (float): time from sending the request to receiving the whole response
+            sent (int): bytes of the request body counted while it was streamed,
+                None to take them from Content-Length
+        """
+
+        metrics = self.get(method)
+        status = response.status_code
+        if sent is None:
+            sent = int(response.request.headers.get('content-length') or 0)
+        received = len(response.content)
+        metrics.attempts += 1
+        metrics.statuses[status] = metrics.statuses.get(status, 0) + 1
+        if status == 429:
+            metrics.rate_limited += 1
+        metrics.bytes_sent += sent
+        metrics.bytes_received += received
+        self.observe(method, 'network', seconds)
+        if self.callback is not None:
+            self.callback(method, 'status', status)
+            self.callback(method, 'bytes_sent', sent)
+            self.callback(method, 'bytes_received', received)
+
+    def on_transport_error(self, method, seconds):
+        metrics = self.get(method)
+        metrics.attempts += 1
+        metrics.transport_errors += 1
+        self.observe(method, 'network', seconds)
+        if self.callback is not None:
+            self.callback(method, 'transport_error', 1)
+
+    def snapshot(self):
+        """Get the metrics as dict of dicts by method name, with mean and approximate p50/p99 of the stages"""
+
+        return {method: metrics.as_dict() for method, metrics in self.methods.items()}
+
+    def prometheus(self):
+        """Get the metrics in the Prometheus text exposition format.
+
+        Returns:
+            str
+        """
+
+        prefix = self.prefix
+        lines = []
+        counters = (
+            ('calls', 'Calls of the bot api method'),
+            ('failed', 'Calls of the bot api method that raised an error'),
+            ('attempts', 'HTTP requests including repeated ones'),
+            ('rate_limited', 'Responses 429 Too Many Requests'),
+            ('transport_errors', 'Requests failed with a network error'),
+            ('bytes_sent', 'Bytes of request bodies'),
+            ('bytes_received', 'Bytes of response bodies'),
+        )
+        for name, help_text in counters:
+            lines.append(f'# HELP {prefix}_{name}_total {help_text}')
+            lines.append(f'# TYPE {prefix}_{name}_total counter')
+            for method, metrics in self.methods.items():
+                lines.append(f'{prefix}_{name}_total{{method="{method}"}} {getattr(metrics, name)}')
+
+        lines.append(f'# HELP {prefix}_responses_total Responses by HTTP status')
+        lines.append(f'# TYPE {prefix}_responses_total counter')
+        for method, metrics in self.methods.items():
+            for status, count in sorted(metrics.statuses.items()):
+                lines.append(f'{prefix}_responses_total{{method="{method}",status="{status}"}} {count}')
+
+        for stage in STAGES:
+            name = f'{prefix}_{stage}_seconds'
+            lines.append(f'# HELP {name} Duration of the {stage.replace("_", " ")} stage of the call')
+            lines.append(f'# TYPE {name} histogram')
+            for method, metrics in self.methods.items():
+                histogram = metrics.histograms[stage]
+                total = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    total += count
+                    lines.append(f'{name}_bucket{{method="{method}",le="{bound}"}} {total}')
+                lines.append(f'{name}_bucket{{method="{method}",le="+Inf"}} {histogram.count}')
+                lines.append(f'{name}_sum{{method="{method}"}} {histogram.sum}')
+                lines.append(f'{name}_count{{method="{method}"}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,86 @@
+import asyncio
+import httpx
+import json
+
+USER = {'id': 123456789, 'is_bot': False, 'first_name': 'Ivan', 'last_name': 'Petrov', 'username': 'ivan', 'language_code': 'ru'}
+CHAT = {'id': 123456789, 'type': 'private', 'first_name': 'Ivan', 'last_name': 'Petrov', 'username': 'ivan'}
+KEYBOARD = {
+    'inline_keyboard': [
+        [{'text': f'button_{row}_{column}', 'callback_data': f'data_{row}_{column}'} for column in range(3)]
+        for row in range(3)
+    ]
+}
+
+
+def make_message(message_id=1, chat=CHAT, user=USER):
+    """Get a json of the typical message with a reply, entities, photo and keyboard"""
+
+    return {
+        'message_id': message_id,
+        'from': user,
+        'chat': chat,
+        'date': 1687000000,
+        'text': 'Hello, @ivan! Look at https://core.telegram.org/bots/api',
+        'entities': [
+            {'type': 'mention', 'offset': 7, 'length': 5},
+            {'type': 'url', 'offset': 22, 'length': 33},
+        ],
+        'reply_to_message': {
+            'message_id': message_id - 1,
+            'from': user,
+            'chat': chat,
+            'date': 1686999990,
+            'photo': [
+                {'file_id': 'AgACAgIAAxkBAAIB', 'file_unique_id': 'AQADzMYxG', 'width': 90, 'height': 90},
+                {'file_id': 'AgACAgIAAxkBAAIC', 'file_unique_id': 'AQADzMYxH', 'width': 320, 'height': 320},
+            ],
+            'caption': 'photo',
+        },
+        'reply_markup': KEYBOARD,
+    }
+
+
+class MockBotApi:
+    """Handler of `httpx.MockTransport` answering bot api requests with canned responses.
+
+    Methods returning a message (send*, edit*, copy, forward) get the typical message
+    from `make_message`, the other methods get True.
+
+    Args:
+        latency (float): seconds to wait before each response
+        flood_every (int): answer every n-th request with the error 429, 0 to never do it
+        retry_after (float): `parameters.retry_after` of the error 429
+    """
+
+    def __init__(self, latency=0.0, flood_every=0, retry_after=1):
+        self.latency = latency
+        self.flood_every = flood_every
+        self.retry_after = retry_after
+        self.requests = 0
+        self.flooded = 0
+        self.bytes_received = 0
+        self.__message = json.dumps({'ok': True, 'result': make_message(2)}).encode()
+        self.__true = b'{"ok":true,"result":true}'
+        self.__flood = json.dumps({
+            'ok': False,
+            'error_code': 429,
+            'description': f'Too Many Requests: retry after {retry_after}',
+            'parameters': {'retry_after': retry_after},
+        }).encode()
+
+    def transport(self):
+        return httpx.MockTransport(self)
+
+    async def __call__(self, request: httpx.Request):
+        self.requests += 1
+        number = self.requests
+        self.bytes_received += len(await request.aread())
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.flood_every and number % self.flood_every == 0:
+            self.flooded += 1
+            return httpx.Response(429, content=self.__flood)
+        method = request.url.path.rsplit('/', 1)[-1]
+        if method.startswith(('send', 'edit', 'copy', 'forward')) and method != 'sendChatAction':
+            return httpx.Response(200, content=self.__message)
+        return httpx.Response(200, content=self.__true)
@@ -0,0 +1,122 @@
+import os
+import sqlite3
+
+
+class UpdateDeduplicator:
+    """Set of recently seen update_id kept as a bitset over a sliding window.
+
+    Only the last `window` ids below the highest seen one are remembered, so memory
+    stays at window / 8 bytes however long the bot runs. An id older than the window
+    is taken as new and starts the window again: Telegram picks the next update_id
+    randomly after a week without updates, and it may be below the old ones.
+
+    Args:
+        window (int): number of the latest update ids to remember
+    """
+
+    def __init__(self, window=1 << 16):
+        self.window = window
+        self.bits = bytearray((window + 7) // 8)
+        self.high = None
+        self.duplicates = 0
+
+    def __contains__(self, update_id):
+        if self.high is None or not self.high - self.window < update_id <= self.high:
+            return False
+        index = update_id % self.window
+        return bool(self.bits[index >> 3] & (1 << (index & 7)))
+
+    def add(self, update_id):
+        """Remember the update.
+
+        Args:
+            update_id (int): id of the update
+        Returns:
+            True if the update is new, False if it was already seen
+        """
+
+        if update_id in self:
+            self.duplicates += 1
+            return False
+        if self.high is None:
+            self.high = update_id
+        elif update_id <= self.high - self.window:
+            self.bits = bytearray(len(self.bits))
+            self.high = update_id
+        elif update_id > self.high:
+            self.__slide(update_id)
+        index = update_id % self.window
+        self.bits[index >> 3] |= 1 << (index & 7)
+        return True
+
+    def __slide(self, high):
+        """Move the window up to `high`, forgetting the ids that leave it"""
+
+        if high - self.high >= self.window:
+            self.bits = bytearray(len(self.bits))
+        else:
+            for update_id in range(self.high + 1, high + 1):
+                index = update_id % self.window
+                self.bits[index >> 3] &= ~(1 << (index & 7))
+        self.high = high
+
+
+class FileOffsetStore:
+    """Offset of getUpdates kept in a text file, written atomically.
+
+    Args:
+        path (str): path of the file
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        """Get the saved offset, None if it is not saved yet"""
+
+        try:
+            with open(self.path, encoding='utf-8') as file:
+                return int(file.read().strip())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def save(self, offset):
+        temp_path = f'{self.path}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            file.write(str(offset))
+        os.replace(temp_path, self.path)
+
+
+class SqliteOffsetStore:
+    """Offset of getUpdates kept in a SQLite database, one row per bot.
+
+    Args:
+        path (str): path of the database file
+        name (str): key of the bot in the table, to keep offsets of several bots in one database
+    """
+
+    def __init__(self, path, name='default'):
+        self.path = path
+        self.name = name
+        self.connection = sqlite3.connect(path)
+        with self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS offsets (name TEXT PRIMARY KEY, offset INTEGER NOT NULL)'
+            )
+
+    def load(self):
+        """Get the saved offset, None if it is not saved yet"""
+
+        row = self.connection.execute('SELECT offset FROM offsets WHERE name = ?', (self.name,)).fetchone()
+        return row[0] if row else None
+
+    def save(self, offset):
+        with self.connection:
+            self.connection.execute(
+                'INSERT INTO offsets (name, offset) VALUES (?, ?) '
+                'ON CONFLICT(name) DO UPDATE SET offset = excluded.offset',
+                (self.name, offset)
+            )
+
+    def close(self):
+        self.connection.close()
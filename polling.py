@@ -0,0 +1,191 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+class Poller:
+    """Receiving of updates by long polling.
+
+    The next `getUpdates` request is started as soon as a batch of updates is received,
+    before the updates of the batch are handled, so the server is always being polled.
+    With `offset_store` the server is polled from the first update not yet handled, as Telegram
+    forgets the updates before the offset: they are confirmed only when handled, so a restart
+    resumes from the first update not handled. Updates after it that were already handled are
+    received and handled again then. Updates received again while being handled are skipped.
+
+    Args:
+        bot: Bot instance
+        handler: coroutine function taking one Update instance
+        timeout (int): long polling timeout in seconds
+        limit (int): max number of updates in one batch, 1-100
+        allowed_updates (list): list of the update types to receive
+        max_pending (int): max number of updates being handled at the same time
+        error_delay (float): delay in seconds before polling again after an error
+        lazy (bool): handle LazyUpdate views instead of Update instances
+        offset_store: FileOffsetStore or SqliteOffsetStore instance to resume from the saved offset after restart,
+            the offset is saved when all updates before it are handled, for a handler returning a future
+            (e.g. Dispatcher) when the future is done
+        deduplicator: UpdateDeduplicator instance to skip updates received again
+        save_interval (float): min seconds between saves of the offset, it is also saved when polling stops
+        recheck_interval (float): with offset_store, max seconds between requests while only updates
+            being handled are received, until one of them is handled
+    """
+
+    def __init__(
+            self,
+            bot,
+            handler,
+            timeout=30,
+            limit=100,
+            allowed_updates=None,
+            max_pending=1000,
+            error_delay=1.0,
+            lazy=False,
+            offset_store=None,
+            deduplicator=None,
+            save_interval=1.0,
+            recheck_interval=1.0
+    ):
+        self.bot = bot
+        self.handler = handler
+        self.timeout = timeout
+        self.limit = limit
+        self.allowed_updates = allowed_updates
+        self.error_delay = error_delay
+        self.lazy = lazy
+        self.offset_store = offset_store
+        self.deduplicator = deduplicator
+        self.save_interval = save_interval
+        self.recheck_interval = recheck_interval
+        self.offset = None
+        self.saved_offset = None
+        self.duplicates = 0
+        # Received update ids in order and the handled ones, to find the first update not yet handled
+        self.__received = deque()
+        self.__handled = set()
+        self.__saved_at = 0.0
+        # Set when the first update not yet handled changes
+        self.__progress = asyncio.Event()
+        self.pending = asyncio.Semaphore(max_pending)
+        self.tasks = set()
+        self.running = False
+        self.__fetch = None
+
+    async def run(self):
+        """Poll and handle updates until `stop` is called"""
+
+        self.running = True
+        if self.offset_store is not None and self.offset is None:
+            self.offset = self.saved_offset = self.offset_store.load()
+        self.__fetch = asyncio.create_task(self.__get_updates())
+        try:
+            while self.running:
+                try:
+                    updates = await self.__fetch
+                except asyncio.CancelledError:
+                    if not self.running:
+                        break
+                    raise
+                received = self.__received
+                wait_progress = False
+                if self.offset_store is not None and received and updates:
+                    # Updates after the offset are not confirmed yet, those being handled are received again
+                    new_updates = [
+                        update for update in updates if not received[0] <= update.update_id <= received[-1]
+                    ]
+                    if not new_updates:
+                        # The same updates would be received at once, so wait until some of them are handled
+                        # or new updates may have come after them
+                        wait_progress = True
+                        self.__progress.clear()
+                    updates = new_updates
+                if updates:
+                    self.offset = updates[-1].update_id + 1
+                if self.deduplicator is not None:
+                    new_updates = [update for update in updates if self.deduplicator.add(update.update_id)]
+                    self.duplicates += len(updates) - len(new_updates)
+                    updates = new_updates
+                if self.offset_store is not None:
+                    received.extend(update.update_id for update in updates)
+                self.__fetch = asyncio.create_task(self.__get_updates(wait_progress))
+                for update in updates:
+                    await self.pending.acquire()
+                    task = asyncio.create_task(self.__handle(update))
+                    self.tasks.add(task)
+                    task.add_done_callback(self.tasks.discard)
+                if self.offset_store is not None:
+                    self.__save_offset()
+        finally:
+            self.running = False
+            self.__fetch.cancel()
+            if self.tasks:
+                await asyncio.gather(*self.tasks, return_exceptions=True)
+            if self.offset_store is not None:
+                self.__save_offset(force=True)
+
+    def stop(self):
+        """Stop polling, `run` returns after the updates being handled are done"""
+        self.running = False
+        if self.__fetch:
+            self.__fetch.cancel()
+
+    async def __get_updates(self, wait_progress=False):
+        if wait_progress:
+            try:
+                await asyncio.wait_for(self.__progress.wait(), self.recheck_interval)
+            except asyncio.TimeoutError:
+                pass
+        while True:
+            try:
+                return await self.bot.get_updates(
+                    # With offset_store only the handled updates are confirmed
+                    offset=self.__received[0] if self.__received else self.offset,
+                    limit=self.limit,
+                    timeout=self.timeout,
+                    allowed_updates=self.allowed_updates,
+                    lazy=self.lazy
+                )
+            except httpx.HTTPError:
+                logger.exception('Failed to get updates')
+                await asyncio.sleep(self.error_delay)
+
+    async def __handle(self, update):
+        try:
+            done = await self.handler(update)
+            # A handler queueing the update (e.g. Dispatcher) returns a future done when it is handled
+            if isinstance(done, asyncio.Future):
+                await done
+        except Exception:
+            logger.exception('Failed to handle update %s', update.update_id)
+        finally:
+            self.pending.release()
+            if self.offset_store is not None:
+                self.__handled.add(update.update_id)
+                self.__save_offset()
+
+    def __save_offset(self, force=False):
+        """Save the offset after the last update before which all updates are handled"""
+
+        received = self.__received
+        if received and received[0] in self.__handled:
+            while received and received[0] in self.__handled:
+                self.__handled.discard(received.popleft())
+            self.__progress.set()
+        offset = received[0] if received else self.offset
+        if offset is None or offset == self.saved_offset:
+            return
+        now = time.monotonic()
+        if not force and now - self.__saved_at < self.save_interval:
+            return
+        try:
+            self.offset_store.save(offset)
+        except OSError:
+            logger.exception('Failed to save offset %s', offset)
+            return
+        self.saved_offset = offset
+        self.__saved_at = now
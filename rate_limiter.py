@@ -0,0 +1,129 @@
+import asyncio
+import time
+
+
+def is_group(chat_id):
+    """Groups, supergroups and channels have negative ids, usernames start with @"""
+    if isinstance(chat_id, str):
+        return chat_id.startswith(('-', '@'))
+    return chat_id < 0
+
+
+class TokenBucket:
+    """Token bucket that hands out reservations instead of blocking.
+
+    Every call to `reserve` takes one token, even if the bucket is empty,
+    and returns the time the caller has to wait for it. Waiters are thus
+    released in arrival order at exactly the configured rate.
+    """
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def reserve(self, at: float) -> float:
+        """Take one token for a request that is not sent before `at`.
+
+        Args:
+            at (float): `time.monotonic()` value the request is ready at
+        Returns:
+            Moment (`time.monotonic()` value) the token may be used
+        """
+
+        if at > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (at - self.updated) * self.rate)
+            self.updated = at
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return self.updated
+        return self.updated - self.tokens / self.rate
+
+    def take(self, now: float) -> float:
+        """Take one token only if it is available at `now`, as the server enforcing the limit does.
+
+        Args:
+            now (float): `time.monotonic()` value
+        Returns:
+            0 if the token is taken, otherwise seconds until a token is available
+        """
+
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def is_idle(self, now: float) -> bool:
+        """True if the bucket would be full again at `now`"""
+        return now >= self.updated and self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+
+class RateLimiter:
+    """Scheduler for outbound requests of the bot.
+
+    Requests are paced by a global bucket and by a bucket per chat_id.
+    A request to one chat never waits for the bucket of another chat.
+    Default limits are taken from here: https://core.telegram.org/bots/faq#my-bot-is-hitting-limits-how-do-i-avoid-this
+
+    Args:
+        global_rate (float): requests per second for the whole bot
+        chat_rate (float): requests per second for one private chat
+        group_rate (float): requests per second for one group or channel
+        burst (int): number of requests a chat may send without waiting
+        max_idle_buckets (int): number of buckets after which idle ones are dropped
+    """
+
+    def __init__(
+            self,
+            global_rate=30,
+            chat_rate=1,
+            group_rate=20 / 60,
+            burst=1,
+            max_idle_buckets=10000
+    ):
+        # Without a burst the requests are evenly spaced, so no one-second window exceeds global_rate
+        self.global_bucket = TokenBucket(global_rate, 1)
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.burst = burst
+        self.max_idle_buckets = max_idle_buckets
+        self.chat_buckets = {}
+
+    async def wait(self, chat_id=None):
+        """Wait until a request to `chat_id` can be sent.
+
+        Args:
+            chat_id: chat of the request or None for requests not bound to a chat
+        """
+
+        if chat_id is not None:
+            now = time.monotonic()
+            ready_at = self.__chat_bucket(chat_id, now).reserve(now)
+            if ready_at > now:
+                await asyncio.sleep(ready_at - now)
+        # The global token is taken only when the chat token is released,
+        # so a busy chat does not hold back requests to other chats
+        now = time.monotonic()
+        ready_at = self.global_bucket.reserve(now)
+        if ready_at > now:
+            await asyncio.sleep(ready_at - now)
+
+    def __chat_bucket(self, chat_id, now):
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self.chat_buckets) >= self.max_idle_buckets:
+                self.__drop_idle_buckets(now)
+            rate = self.group_rate if is_group(chat_id) else self.chat_rate
+            bucket = self.chat_buckets[chat_id] = TokenBucket(rate, self.burst)
+        return bucket
+
+    def __drop_idle_buckets(self, now):
+        self.chat_buckets = {
+            chat_id: bucket for chat_id, bucket in self.chat_buckets.items() if not bucket.is_idle(now)
+        }
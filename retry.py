@@ -0,0 +1,70 @@
+import random
+
+import httpx
+
+
+class RetryPolicy:
+    """Settings for repeating failed requests to the bot api.
+
+    Server errors and network errors are repeated with exponential backoff and full jitter.
+    Errors 429 are repeated exactly after `parameters.retry_after` seconds from the response.
+    See here: https://core.telegram.org/bots/api#responseparameters
+
+    Args:
+        max_attempts (int): max number of attempts for one call, including the first one
+        backoff (float): base delay in seconds before the second attempt
+        max_backoff (float): upper bound of the backoff delay
+        deadline (float): max time in seconds for one call with all its attempts, None for no limit,
+            getUpdates gets its long polling timeout on top of it; httpx.TimeoutException is raised when it is exceeded
+        retry_statuses (tuple): http statuses that are repeated with backoff
+    """
+
+    def __init__(
+            self,
+            max_attempts=5,
+            backoff=0.5,
+            max_backoff=30,
+            deadline=None,
+            retry_statuses=(500, 502, 503, 504)
+    ):
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.deadline = deadline
+        self.retry_statuses = retry_statuses
+
+    def get_delay(self, attempt: int, response: httpx.Response = None):
+        """Get the delay before the next attempt.
+
+        Args:
+            attempt (int): number of the failed attempt, starting from 1
+            response: response of the failed attempt, None for network errors
+        Returns:
+            Delay in seconds or None if the request should not be repeated
+        """
+
+        if attempt >= self.max_attempts:
+            return None
+        if response is not None:
+            if response.status_code == 429:
+                delay = retry_after(response)
+                if delay is not None:
+                    return delay
+            elif response.status_code not in self.retry_statuses:
+                return None
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+
+
+def retry_after(response: httpx.Response):
+    """Get `parameters.retry_after` from the error response of the bot api.
+
+    Args:
+        response: httpx._models.Response instance
+    Returns:
+        Seconds to wait or None if the response does not contain it
+    """
+
+    try:
+        return response.json()['parameters']['retry_after']
+    except (ValueError, KeyError, TypeError):
+        return None
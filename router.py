@@ -0,0 +1,199 @@
+import tg_obj
+
+# Fields of Update holding its content, in the order of the model
+UPDATE_TYPES = tuple(name for name in tg_obj.Update.__fields__ if name != 'update_id')
+
+
+def get_update_type(update):
+    """Get the name of the field of the update that is set, e.g. 'message' or 'callback_query'.
+
+    Args:
+        update: Update or LazyUpdate instance
+    Returns:
+        str or None if the update has none of the known fields
+    """
+
+    for update_type in UPDATE_TYPES:
+        if getattr(update, update_type, None) is not None:
+            return update_type
+    return None
+
+
+def parse_command(text):
+    """Split the text of the message starting with a bot command.
+
+    Args:
+        text (str): text of the message
+    Returns:
+        (command, username, args): name of the command without the slash, the bot username after @
+        or None and the rest of the text; None if the text is not a command
+    """
+
+    if not text or text[0] != '/':
+        return None
+    head, _, args = text[1:].partition(' ')
+    head, _, rest = head.partition('\n')
+    if rest:
+        args = f'{rest} {args}' if args else rest
+    command, _, username = head.partition('@')
+    if not command:
+        return None
+    return command, username or None, args.strip()
+
+
+class PrefixTrie:
+    """Trie of string prefixes, the lookup takes the length of the key and not the number of prefixes."""
+
+    __slots__ = ('root', 'size')
+
+    def __init__(self):
+        # Children are kept by their character, the value of the node is kept by None
+        self.root = {}
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, prefix, value):
+        node = self.root
+        for char in prefix:
+            node = node.setdefault(char, {})
+        if None in node:
+            raise ValueError(f'Prefix {prefix!r} is already added')
+        node[None] = value
+        self.size += 1
+
+    def longest(self, key):
+        """Get the value of the longest prefix of the key, None if no prefix matches"""
+
+        node = self.root
+        value = node.get(None)
+        for char in key:
+            node = node.get(char)
+            if node is None:
+                break
+            if None in node:
+                value = node[None]
+        return value
+
+
+class Router:
+    """Handler of updates choosing the handler by the type of the update,
+    the bot command of the message and the prefix of callback_data.
+
+    Commands are looked up in a dict by name, callback_data in a prefix trie taking the handler
+    of the longest registered prefix, so the lookup does not depend on the number of handlers.
+    An update not matched by a command or a prefix goes to the handler of its type, then to `default`.
+    The instance is a coroutine function taking one Update, so it can be passed as the handler
+    to `Poller`, `WebhookApp` or `Dispatcher`.
+
+    Args:
+        username (str): username of the bot, commands addressed to other bots (/start@other_bot) are not matched;
+            None to match commands with any username. Usernames are compared ignoring case, as in Telegram
+        default: coroutine function for updates without a handler, None to ignore them
+    """
+
+    def __init__(self, username=None, default=None):
+        self.username = username.lstrip('@').lower() if username else None
+        self.default = default
+        self.type_handlers = {}
+        self.commands = {}
+        self.callbacks = PrefixTrie()
+
+    async def __call__(self, update):
+        handler = self.resolve(update)
+        if handler is not None:
+            return await handler(update)
+
+    def resolve(self, update):
+        """Get the handler of the update.
+
+        Args:
+            update: Update or LazyUpdate instance
+        Returns:
+            coroutine function or None if there is no handler for the update
+        """
+
+        message = getattr(update, 'message', None)
+        if message is not None:
+            if self.commands:
+                command = parse_command(getattr(message, 'text', None))
+                if command is not None and (
+                        self.username is None or command[1] is None or command[1].lower() == self.username):
+                    handler = self.commands.get(command[0])
+                    if handler is not None:
+                        return handler
+            return self.type_handlers.get('message', self.default)
+
+        callback_query = getattr(update, 'callback_query', None)
+        if callback_query is not None:
+            data = getattr(callback_query, 'data', None)
+            if data is not None and self.callbacks:
+                handler = self.callbacks.longest(data)
+                if handler is not None:
+                    return handler
+            return self.type_handlers.get('callback_query', self.default)
+
+        return self.type_handlers.get(get_update_type(update), self.default)
+
+    def add_handler(self, update_type, handler):
+        """Handle updates of the type not matched by commands and callback_data prefixes.
+
+        Args:
+            update_type (str): name of the field of Update, e.g. 'message' or 'inline_query'
+            handler: coroutine function taking one Update instance
+        """
+
+        if update_type not in UPDATE_TYPES:
+            raise ValueError(f'Unknown update type {update_type!r}')
+        if update_type in self.type_handlers:
+            raise ValueError(f'Handler of {update_type!r} updates is already added')
+        self.type_handlers[update_type] = handler
+
+    def add_command(self, command, handler):
+        """Handle messages with the bot command.
+
+        Args:
+            command (str): name of the command with or without the slash, e.g. 'start'
+            handler: coroutine function taking one Update instance
+        """
+
+        command = command.lstrip('/')
+        if command in self.commands:
+            raise ValueError(f'Handler of the command {command!r} is already added')
+        self.commands[command] = handler
+
+    def add_callback(self, prefix, handler):
+        """Handle callback queries whose data starts with the prefix, the longest matching prefix wins.
+
+        Args:
+            prefix (str): prefix of callback_data, '' for all callback queries
+            handler: coroutine function taking one Update instance
+        """
+
+        self.callbacks.add(prefix, handler)
+
+    def on(self, update_type):
+        """Decorator form of `add_handler`"""
+
+        def decorator(handler):
+            self.add_handler(update_type, handler)
+            return handler
+        return decorator
+
+    def command(self, *commands):
+        """Decorator form of `add_command` for one or more commands"""
+
+        def decorator(handler):
+            for command in commands:
+                self.add_command(command, handler)
+            return handler
+        return decorator
+
+    def callback_query(self, prefix=''):
+        """Decorator form of `add_callback`"""
+
+        def decorator(handler):
+            self.add_callback(prefix, handler)
+            return handler
+        return decorator
@@ -0,0 +1,29 @@
+import asyncio
+import httpx
+
+from bot import Bot
+from fake_server import FakeBotApi
+from media import FileIdCache, InputFile
+
+
+def test_file_id_of_photo_is_not_sent_as_document():
+    async def send():
+        content_types = []
+
+        async def on_request(request):
+            content_types.append(request.headers['content-type'].partition(';')[0])
+
+        transport = httpx.ASGITransport(FakeBotApi(token='token', update_rate=0))
+        async with httpx.AsyncClient(transport=transport, event_hooks={'request': [on_request]}) as session:
+            cache = FileIdCache(autosave=False)
+            bot = Bot('token', session, base_url='http://fake', file_id_cache=cache)
+            data = b'x' * 1000
+            photo = await bot.send_photo(1, InputFile(data, 'a.jpg'))
+            document = await bot.send_document(2, InputFile(data, 'a.jpg'))
+            await bot.send_photo(3, InputFile(data, 'a.jpg'))
+        return content_types, photo, document, cache
+
+    content_types, photo, document, cache = asyncio.run(send())
+    assert content_types == ['multipart/form-data', 'multipart/form-data', 'application/json']
+    assert document.document['file_id'] != photo.photo[-1]['file_id']
+    assert len(cache.file_ids) == 2
@@ -1,9 +1,39 @@
 from __future__ import annotations
 
 import httpx
+import json
+import retry
 
-from pydantic import BaseModel as GeneralBaseModel, root_validator, AnyHttpUrl, Field
-from typing import Any, Union, TypeVar
+from collections import OrderedDict
+
+from pydantic import BaseModel as GeneralBaseModel, root_validator, AnyHttpUrl, Field, PrivateAttr
+from pydantic.fields import SHAPE_LIST, SHAPE_SINGLETON
+from typing import Any, NamedTuple, Union, TypeVar
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads(data):
+    """Decode json with orjson if it is installed"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj) -> bytes:
+    """Encode json with orjson if it is installed, models are encoded by their aliases without None fields"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_to_jsonable)
+    return json.dumps(obj, default=_to_jsonable, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+def _to_jsonable(obj):
+    if isinstance(obj, GeneralBaseModel):
+        return obj.dict(by_alias=True, exclude_none=True)
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
 
 
 class BaseModel(GeneralBaseModel):
@@ -16,8 +46,184 @@ class BaseModel(GeneralBaseModel):
                 del values[key]
         return values
 
+    @classmethod
+    def parse_trusted(cls, data):
+        """Build the model without validation, only for data coming from Telegram.
+
+        The result is the same as of `parse_obj` for valid data: None fields are dropped,
+        nested models are built, unknown fields are ignored. Types are not checked.
+
+        Args:
+            data: json as bytes or str, or decoded as dict
+        Returns:
+            Model instance
+        """
+
+        if not isinstance(data, dict):
+            data = loads(data)
+        return cls.build_trusted(data)
+
+    @classmethod
+    def build_trusted(cls, data: dict):
+        """Build the model from the decoded json without validation, see `parse_trusted`"""
+
+        plan = _trusted_plans.get(cls)
+        if plan is None:
+            plan = _trusted_plans[cls] = _make_trusted_plan(cls)
+        values = {}
+        for key, value in data.items():
+            field = plan.get(key)
+            if field is None or value is None:
+                continue
+            name, build = field
+            values[name] = value if build is None else build(value)
+        return _construct(cls, values)
+
+
+def _construct(model, values):
+    """Create the model instance from ready values of its fields without any checks"""
+
+    obj = model.__new__(model)
+    object.__setattr__(obj, '__dict__', values)
+    object.__setattr__(obj, '__fields_set__', set(values))
+    if model.__private_attributes__:
+        obj._init_private_attributes()
+    return obj
+
+
+# Model -> {alias: (field name, builder of the value or None to keep it as is)}
+_trusted_plans = {}
+
+
+def _make_trusted_plan(model):
+    return {field.alias: (name, _make_trusted_builder(field)) for name, field in model.__fields__.items()}
+
+
+def _make_trusted_builder(field):
+    """Get the function building the value of the field from json, None if json is used as is"""
+
+    if field.shape == SHAPE_LIST:
+        build_item = _make_trusted_builder(field.sub_fields[0])
+        if build_item is None:
+            return None
+        return lambda value: [build_item(item) for item in value]
+    if field.shape != SHAPE_SINGLETON:
+        return None
+    if not field.sub_fields:
+        if isinstance(field.type_, type) and issubclass(field.type_, BaseModel):
+            return field.type_.build_trusted
+        return None
+
+    # Union: like pydantic, take the first model whose required fields are present
+    models = [
+        (sub_field.type_, {f.alias for f in sub_field.type_.__fields__.values() if f.required})
+        for sub_field in field.sub_fields
+        if isinstance(sub_field.type_, type) and issubclass(sub_field.type_, BaseModel)
+    ]
+    if not models:
+        return None
+
+    def build_union(value):
+        if isinstance(value, dict):
+            for model, required in models:
+                if required.issubset(value):
+                    return model.build_trusted(value)
+        return value
+
+    return build_union
+
+
+class InternCache:
+    """LRU cache of immutable model instances shared between updates.
+
+    Instances built from equal json are the same object, so repeat senders cost
+    neither allocation nor validation. Json with unhashable values is not cached.
+
+    Args:
+        maxsize (int): max number of cached instances
+    """
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self.objects = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def hit_rate(self):
+        requests = self.hits + self.misses
+        return self.hits / requests if requests else 0.0
+
+    def get(self, model, data: dict, build):
+        """Get the cached instance of the model for the json or build and cache it.
+
+        Args:
+            model: class of the model
+            data (dict): decoded json of the model
+            build: function building the instance from json
+        Returns:
+            Model instance
+        """
+
+        try:
+            key = (model, frozenset(data.items()))
+        except TypeError:
+            return build(data)
+        obj = self.objects.get(key)
+        if obj is not None:
+            self.hits += 1
+            self.objects.move_to_end(key)
+            return obj
+        self.misses += 1
+        obj = self.objects[key] = build(data)
+        if len(self.objects) > self.maxsize:
+            self.objects.popitem(last=False)
+            self.evictions += 1
+        return obj
+
+
+intern_cache = None
+
+
+def enable_interning(maxsize=10000):
+    """Share User and Chat instances built from equal json, see `InternCache`.
+
+    Interned instances are immutable.
+
+    Args:
+        maxsize (int): max number of cached instances
+    Returns:
+        InternCache instance with the hit counters
+    """
+
+    global intern_cache
+    intern_cache = InternCache(maxsize)
+    return intern_cache
+
+
+def disable_interning():
+    global intern_cache
+    intern_cache = None
+
+
+class InternedModel(BaseModel):
+    """Class for models shared through the `intern_cache` when it is enabled"""
+
+    @classmethod
+    def validate(cls, value):
+        if intern_cache is None or not isinstance(value, dict) or not cls.__config__.allow_mutation:
+            return super().validate(value)
+        return intern_cache.get(cls, value, _frozen_models[cls].parse_obj)
+
+    @classmethod
+    def build_trusted(cls, data: dict):
+        if intern_cache is None or not cls.__config__.allow_mutation:
+            return super().build_trusted(data)
+        return intern_cache.get(cls, data, _frozen_models[cls].build_trusted)
+
 
-class User(BaseModel):
+class User(InternedModel):
     """This model represents a Telegram user or bot
 
     See here: https://core.telegram.org/bots/api#user
@@ -36,7 +242,7 @@ class User(BaseModel):
     supports_inline_queries: bool = None
 
 
-class Chat(BaseModel):
+class Chat(InternedModel):
     """This model represents a chat
 
     See here: https://core.telegram.org/bots/api#chat
@@ -71,6 +277,23 @@ class Chat(BaseModel):
     linked_chat_id: int = None
 
 
+class FrozenUser(User):
+    """Immutable User returned by the intern_cache"""
+
+    class Config:
+        allow_mutation = False
+
+
+class FrozenChat(Chat):
+    """Immutable Chat returned by the intern_cache"""
+
+    class Config:
+        allow_mutation = False
+
+
+_frozen_models = {User: FrozenUser, Chat: FrozenChat}
+
+
 class KeyboardButton(BaseModel):
     """This model represents one button of the reply keyboard.
     For simple text buttons, String can be used instead of this model to specify the button text.
@@ -155,6 +378,79 @@ class InlineKeyboardMarkup(BaseModel):
     inline_keyboard: list[list[InlineKeyboardButton]]
 
 
+class FrozenMarkup(BaseModel):
+    """Class for keyboards serialized once on creation.
+
+    `json()` without arguments returns the cached string and `json_bytes` the cached
+    bytes, so the keyboard costs nothing to send again.
+    The keyboard and its buttons must not be changed.
+    """
+
+    _json: str = PrivateAttr()
+    _json_bytes: bytes = PrivateAttr()
+
+    class Config:
+        allow_mutation = False
+
+    def __init__(self, **data):
+        super().__init__(**data)
+        self._json_bytes = dumps(self)
+        self._json = self._json_bytes.decode()
+
+    @property
+    def json_bytes(self):
+        return self._json_bytes
+
+    def json(self, **kwargs):
+        if kwargs:
+            return super().json(**kwargs)
+        return self._json
+
+
+class FrozenInlineKeyboardMarkup(FrozenMarkup, InlineKeyboardMarkup):
+    """InlineKeyboardMarkup serialized once, see `FrozenMarkup`"""
+
+
+class FrozenReplyKeyboardMarkup(FrozenMarkup, ReplyKeyboardMarkup):
+    """ReplyKeyboardMarkup serialized once, see `FrozenMarkup`"""
+
+
+def _grid(items, columns):
+    return [items[start:start + columns] for start in range(0, len(items), columns)]
+
+
+def inline_keyboard(buttons, columns=3):
+    """Build the frozen inline keyboard with buttons in rows of `columns`.
+
+    Args:
+        buttons: InlineKeyboardButton instances or (text, callback_data) pairs
+        columns (int): number of buttons in a row
+    Returns:
+        FrozenInlineKeyboardMarkup instance
+    """
+
+    buttons = [
+        button if isinstance(button, InlineKeyboardButton) else InlineKeyboardButton(text=button[0], callback_data=button[1])
+        for button in buttons
+    ]
+    return FrozenInlineKeyboardMarkup(inline_keyboard=_grid(buttons, columns))
+
+
+def reply_keyboard(buttons, columns=3, **options):
+    """Build the frozen reply keyboard with buttons in rows of `columns`.
+
+    Args:
+        buttons: KeyboardButton instances or texts of buttons
+        columns (int): number of buttons in a row
+        options: other fields of ReplyKeyboardMarkup, e.g. resize_keyboard
+    Returns:
+        FrozenReplyKeyboardMarkup instance
+    """
+
+    buttons = [button if isinstance(button, KeyboardButton) else KeyboardButton(text=button) for button in buttons]
+    return FrozenReplyKeyboardMarkup(keyboard=_grid(buttons, columns), **options)
+
+
 class Invoice(BaseModel):
     """This model contains basic information about an invoice
 
@@ -304,6 +600,75 @@ class MessageEntity(BaseModel):
     custom_emoji_id: str = None
 
 
+class InputMediaPhoto(BaseModel):
+    """This model represents a photo to be sent.
+    media is a file_id, a URL or a file to upload, see `media.InputFile`.
+
+    See here: https://core.telegram.org/bots/api#inputmediaphoto
+    """
+
+    type: str = Field(default='photo', const=True)
+    media: Any
+    caption: str = None
+    parse_mode: str = None
+    caption_entities: list[MessageEntity] = None
+    has_spoiler: bool = None
+
+
+class InputMediaVideo(BaseModel):
+    """This model represents a video to be sent.
+    media and thumbnail are a file_id, a URL or a file to upload, see `media.InputFile`.
+
+    See here: https://core.telegram.org/bots/api#inputmediavideo
+    """
+
+    type: str = Field(default='video', const=True)
+    media: Any
+    thumbnail: Any = None
+    caption: str = None
+    parse_mode: str = None
+    caption_entities: list[MessageEntity] = None
+    width: int = None
+    height: int = None
+    duration: int = None
+    supports_streaming: bool = None
+    has_spoiler: bool = None
+
+
+class InputMediaAudio(BaseModel):
+    """This model represents an audio file to be treated as music to be sent.
+    media and thumbnail are a file_id, a URL or a file to upload, see `media.InputFile`.
+
+    See here: https://core.telegram.org/bots/api#inputmediaaudio
+    """
+
+    type: str = Field(default='audio', const=True)
+    media: Any
+    thumbnail: Any = None
+    caption: str = None
+    parse_mode: str = None
+    caption_entities: list[MessageEntity] = None
+    duration: int = None
+    performer: str = None
+    title: str = None
+
+
+class InputMediaDocument(BaseModel):
+    """This model represents a general file to be sent.
+    media and thumbnail are a file_id, a URL or a file to upload, see `media.InputFile`.
+
+    See here: https://core.telegram.org/bots/api#inputmediadocument
+    """
+
+    type: str = Field(default='document', const=True)
+    media: Any
+    thumbnail: Any = None
+    caption: str = None
+    parse_mode: str = None
+    caption_entities: list[MessageEntity] = None
+    disable_content_type_detection: bool = None
+
+
 class Update(BaseModel):
     """This model represents an incoming update.
     At most one of the optional parameters can be present in any given update.
@@ -348,8 +713,8 @@ class Location(BaseModel):
     See here: https://core.telegram.org/bots/api#location
     """
 
-    longitude: float
-    latitude: float
+    longitude: float = Field(ge=-180, le=180)
+    latitude: float = Field(ge=-90, le=90)
     horizontal_accuracy: float = Field(default=None, ge=0, le=1500)
     live_period: int = None
     heading: int = Field(default=None, ge=1, le=360)
@@ -610,8 +975,185 @@ class MessageReplyMarkup(BaseModel):
     message_reply_markup: Union[Message, bool]
 
 
+class CompactUser(NamedTuple):
+    """Read-only tuple-backed User for long-lived caches, several times smaller than the model"""
+
+    id: int
+    is_bot: bool
+    first_name: str
+    last_name: str = None
+    username: str = None
+    language_code: str = None
+    is_premium: bool = None
+    added_to_attachment_menu: bool = None
+    can_join_groups: bool = None
+    can_read_all_group_messages: bool = None
+    supports_inline_queries: bool = None
+
+    @classmethod
+    def from_model(cls, user: User):
+        return cls(**user.__dict__)
+
+    def to_model(self) -> User:
+        return _construct(User, {name: value for name, value in zip(self._fields, self) if value is not None})
+
+
+class CompactChat(NamedTuple):
+    """Read-only tuple-backed Chat for long-lived caches.
+
+    Only the fields present in messages have their own items,
+    the fields returned by getChat are kept in `extra`.
+    """
+
+    id: int
+    type: str
+    title: str = None
+    username: str = None
+    first_name: str = None
+    last_name: str = None
+    is_forum: bool = None
+    extra: dict = None
+
+    @classmethod
+    def from_model(cls, chat: Chat):
+        values = dict(chat.__dict__)
+        extra = {name: values.pop(name) for name in chat.__dict__ if name not in cls._fields}
+        return cls(**values, extra=extra or None)
+
+    def to_model(self) -> Chat:
+        values = {name: value for name, value in zip(self._fields, self) if value is not None}
+        values.update(values.pop('extra', {}))
+        return _construct(Chat, values)
+
+
+class CompactMessageEntity(NamedTuple):
+    """Read-only tuple-backed MessageEntity for long-lived caches"""
+
+    type: str
+    offset: int
+    length: int
+    url: str = None
+    user: CompactUser = None
+    language: str = None
+    custom_emoji_id: str = None
+
+    @classmethod
+    def from_model(cls, entity: MessageEntity):
+        values = dict(entity.__dict__)
+        if 'user' in values:
+            values['user'] = CompactUser.from_model(values['user'])
+        return cls(**values)
+
+    def to_model(self) -> MessageEntity:
+        values = {name: value for name, value in zip(self._fields, self) if value is not None}
+        if 'user' in values:
+            values['user'] = values['user'].to_model()
+        return _construct(MessageEntity, values)
+
+
+class LazyModel:
+    """Read-only view of the model over its decoded json.
+
+    Fields are taken from json on the first access, nested models are built then
+    without validation (see `BaseModel.parse_trusted`) and cached.
+    Like in the model, missing fields raise AttributeError.
+
+    Args:
+        raw (dict): decoded json of the model
+    """
+
+    __slots__ = ('raw', 'cache')
+    model = None
+
+    def __init__(self, raw: dict):
+        self.raw = raw
+        self.cache = {}
+
+    @classmethod
+    def parse_raw(cls, data):
+        """Get the view of json as bytes or str"""
+        return cls(loads(data))
+
+    @classmethod
+    def parse_obj(cls, data: dict):
+        """Get the view of the decoded json"""
+        return cls(data)
+
+    build_trusted = parse_obj
+
+    def __getattr__(self, name):
+        # Slots not set yet (copy and pickle create the object without __init__) and special names
+        # are not fields, looking them up in the cache would call __getattr__ again
+        if name.startswith('_') or name in LazyModel.__slots__:
+            raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+        try:
+            return self.cache[name]
+        except KeyError:
+            pass
+        plan = _lazy_plans.get(type(self))
+        if plan is None:
+            plan = _lazy_plans[type(self)] = _make_lazy_plan(self.model)
+        field = plan.get(name)
+        if field is None:
+            raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+        alias, build = field
+        value = self.raw.get(alias)
+        if value is None:
+            raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+        if build is not None:
+            value = self.cache[name] = build(value)
+        return value
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.raw!r})'
+
+    def __reduce__(self):
+        # Copies and pickles are views of the same json, built fields are built again
+        return type(self), (self.raw,)
+
+    def materialize(self):
+        """Get the model instance with all fields built"""
+        return self.model.build_trusted(self.raw)
+
+
+class LazyMessage(LazyModel):
+    """Lazy view of Message, replies and pinned messages are lazy too"""
+
+    __slots__ = ()
+    model = Message
+
+
+class LazyUpdate(LazyModel):
+    """Lazy view of Update, its messages are LazyMessage"""
+
+    __slots__ = ()
+    model = Update
+
+
+# LazyModel subclass -> {field name: (alias, builder of the value or None to return json as is)}
+_lazy_plans = {}
+_lazy_views = {Message: LazyMessage, Update: LazyUpdate}
+
+
+def _make_lazy_plan(model):
+    plan = {}
+    for name, field in model.__fields__.items():
+        view = _lazy_views.get(field.type_) if field.shape == SHAPE_SINGLETON else None
+        plan[name] = (field.alias, view or _make_trusted_builder(field))
+    return plan
+
+
+for model in list(globals().values()):
+    if isinstance(model, type) and issubclass(model, BaseModel):
+        model.update_forward_refs()
+
+
 class TgHTTPStatusError(httpx._exceptions.HTTPStatusError):
-    pass
+
+    @property
+    def retry_after(self):
+        """Seconds to wait before repeating the request if flood control was exceeded"""
+        return retry.retry_after(self.response)
 
 
 class TgRuntimeError(RuntimeError):
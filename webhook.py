@@ -0,0 +1,173 @@
+import asyncio
+import hmac
+import logging
+import tg_obj
+
+from pydantic import ValidationError
+
+logger = logging.getLogger(__name__)
+
+
+class WebhookApp:
+    """ASGI application receiving updates sent to the webhook.
+
+    The update is acknowledged as soon as it is parsed and put in the queue,
+    handling is done by the pool of workers draining the queue.
+    If the queue is full, 503 is returned and Telegram repeats the update later.
+
+    Args:
+        handler: coroutine function taking one Update instance
+        secret_token (str): the secret_token passed to `Bot.set_webhook`
+        path (str): path of the webhook url
+        queue_size (int): max number of updates waiting to be handled
+        workers (int): number of workers handling updates
+        deduplicator: UpdateDeduplicator instance to acknowledge repeated deliveries of an update without handling
+    """
+
+    def __init__(self, handler, secret_token=None, path='/', queue_size=1000, workers=10, deduplicator=None):
+        self.handler = handler
+        self.secret_token = secret_token.encode() if secret_token else None
+        self.path = path
+        self.queue_size = queue_size
+        self.workers = workers
+        self.deduplicator = deduplicator
+        self.queue = None
+        self.tasks = []
+        self.received = 0
+        self.rejected = 0
+        self.invalid = 0
+        self.duplicates = 0
+        self.handled = 0
+        self.failed = 0
+        self.max_queue_depth = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def metrics(self):
+        """Get the counters of the webhook.
+
+        Returns:
+            dict with the numbers of received, rejected (queue full), invalid, duplicate, handled and failed updates,
+            current and max depth of the queue and average and max time of waiting in the queue in seconds
+        """
+
+        return {
+            'received': self.received,
+            'rejected': self.rejected,
+            'invalid': self.invalid,
+            'duplicates': self.duplicates,
+            'handled': self.handled,
+            'failed': self.failed,
+            'queue_depth': self.queue.qsize() if self.queue else 0,
+            'max_queue_depth': self.max_queue_depth,
+            'avg_wait': self.total_wait / (self.handled + self.failed) if self.handled + self.failed else 0.0,
+            'max_wait': self.max_wait,
+        }
+
+    def start(self):
+        """Start the workers, called on the lifespan startup or on the first update"""
+        if self.queue is None:
+            self.queue = asyncio.Queue(self.queue_size)
+            self.tasks = [asyncio.create_task(self.__worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """Handle the updates left in the queue and stop the workers"""
+        if self.queue is None:
+            return
+        await self.queue.join()
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.queue = None
+        self.tasks = []
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.__lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+        if scope['path'] != self.path:
+            await self.__respond(send, 404)
+            return
+        if scope['method'] != 'POST':
+            await self.__respond(send, 405)
+            return
+        if self.secret_token:
+            token = dict(scope['headers']).get(b'x-telegram-bot-api-secret-token', b'')
+            if not hmac.compare_digest(token, self.secret_token):
+                await self.__respond(send, 403)
+                return
+
+        body = await self.__read_body(receive)
+        self.received += 1
+        try:
+            update = tg_obj.Update.parse_raw(body)
+        except (ValidationError, ValueError):
+            self.invalid += 1
+            await self.__respond(send, 400)
+            return
+
+        if self.deduplicator is not None and update.update_id in self.deduplicator:
+            self.duplicates += 1
+            await self.__respond(send, 200)
+            return
+
+        self.start()
+        try:
+            self.queue.put_nowait((update, asyncio.get_running_loop().time()))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            await self.__respond(send, 503)
+            return
+        # The update is remembered only when it is accepted, so the redelivery after 503 is handled
+        if self.deduplicator is not None:
+            self.deduplicator.add(update.update_id)
+        self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+        await self.__respond(send, 200)
+
+    async def __worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            update, queued_at = await self.queue.get()
+            wait = loop.time() - queued_at
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            try:
+                await self.handler(update)
+                self.handled += 1
+            except Exception:
+                self.failed += 1
+                logger.exception('Failed to handle update %s', update.update_id)
+            finally:
+                self.queue.task_done()
+
+    async def __lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self.start()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.stop()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    @staticmethod
+    async def __read_body(receive):
+        body = b''
+        more_body = True
+        while more_body:
+            message = await receive()
+            body += message.get('body', b'')
+            more_body = message.get('more_body', False)
+        return body
+
+    @staticmethod
+    async def __respond(send, status):
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'text/plain'), (b'content-length', b'0')],
+        })
+        await send({'type': 'http.response.body', 'body': b''})
@@ -0,0 +1,196 @@
+import asyncio
+import httpx
+import logging
+import multiprocessing
+import os
+import threading
+import tg_obj
+from pydantic import ValidationError
+
+from bot import Bot
+from dispatcher import CHAT_FIELDS, USER_FIELDS, Dispatcher
+
+logger = logging.getLogger(__name__)
+
+
+def get_raw_chat_id(data: dict):
+    """Get the id of the chat or user the raw update belongs to, see `dispatcher.get_chat_id`.
+
+    Args:
+        data (dict): decoded json of the update
+    Returns:
+        id of the chat or user or None
+    """
+
+    for field in CHAT_FIELDS:
+        obj = data.get(field)
+        if obj is not None:
+            return obj['chat']['id']
+    for field in USER_FIELDS:
+        obj = data.get(field)
+        if obj is not None:
+            return obj['from']['id']
+    poll_answer = data.get('poll_answer')
+    if poll_answer is not None:
+        return poll_answer['user']['id']
+    return None
+
+
+def get_update_id(raw_update):
+    """Get update_id of the raw update that may be not valid, None if it is not known"""
+
+    try:
+        update_id = tg_obj.loads(raw_update).get('update_id')
+    except (ValueError, AttributeError):
+        return None
+    return update_id if isinstance(update_id, int) else None
+
+
+class WorkerPool:
+    """Pool of processes handling updates, sharded by chat id.
+
+    All updates of one chat go to the same process, which handles them in order
+    with its own `Dispatcher`. Each process has its own `Bot` and `httpx.AsyncClient`.
+    Results of the handler are sent back over the pipe and passed to `on_result`.
+
+    Args:
+        tg_token (str): token of the bot
+        handler: coroutine function taking Bot and Update instances, must be picklable
+            (defined at module level), its return value must be picklable too
+        processes (int): number of processes, the number of cpu by default
+        on_result: function taking update_id, result and error (str or None), called in the
+            thread of the event loop running at `start` or in the reader thread if there is none;
+            an update that is not valid gets its error too, with update_id None if it is not json
+        bot_kwargs (dict): other parameters of `Bot` in the processes, e.g. base_url or retry_policy,
+            must be picklable. Each process gets its own copy of a rate_limiter, so its global_rate
+            should be divided by the number of processes
+    """
+
+    def __init__(self, tg_token, handler, processes=None, on_result=None, bot_kwargs=None):
+        self.tg_token = tg_token
+        self.handler = handler
+        self.bot_kwargs = bot_kwargs or {}
+        self.processes = processes or os.cpu_count()
+        self.on_result = on_result
+        self.workers = []
+        self.connections = []
+        self.readers = []
+        self.__round_robin = 0
+        self.__loop = None
+
+    def start(self):
+        """Start the processes"""
+
+        try:
+            self.__loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.__loop = None
+        context = multiprocessing.get_context('spawn')
+        for _ in range(self.processes):
+            parent_connection, child_connection = context.Pipe()
+            worker = context.Process(
+                target=run_worker,
+                args=(self.tg_token, self.handler, child_connection, self.bot_kwargs),
+                daemon=True
+            )
+            worker.start()
+            child_connection.close()
+            reader = threading.Thread(target=self.__read_results, args=(parent_connection,), daemon=True)
+            reader.start()
+            self.workers.append(worker)
+            self.connections.append(parent_connection)
+            self.readers.append(reader)
+
+    def stop(self):
+        """Stop the processes after they have handled all sent updates"""
+
+        for connection in self.connections:
+            try:
+                connection.send_bytes(b'')
+            except OSError:
+                # The process has already exited
+                pass
+        for worker in self.workers:
+            worker.join()
+        for reader in self.readers:
+            reader.join()
+        self.workers, self.connections, self.readers = [], [], []
+
+    def submit(self, raw_update, chat_id=None):
+        """Send the update to the process of its chat.
+
+        The update is decoded here only to find its chat, pass `chat_id` if it is already known
+        to send the raw json as is.
+
+        Args:
+            raw_update: json of the update as bytes or str, or decoded as dict
+            chat_id (int): id of the chat or user of the update, see `get_raw_chat_id`
+        """
+
+        if isinstance(raw_update, dict):
+            if chat_id is None:
+                chat_id = get_raw_chat_id(raw_update)
+            raw_update = tg_obj.dumps(raw_update)
+        else:
+            if chat_id is None:
+                chat_id = get_raw_chat_id(tg_obj.loads(raw_update))
+            if isinstance(raw_update, str):
+                raw_update = raw_update.encode()
+        if chat_id is None:
+            index = self.__round_robin = (self.__round_robin + 1) % self.processes
+        else:
+            index = chat_id % self.processes
+        self.connections[index].send_bytes(raw_update)
+
+    def __read_results(self, connection):
+        while True:
+            try:
+                result = connection.recv()
+            except (EOFError, OSError):
+                return
+            if self.on_result is None:
+                continue
+            if self.__loop is not None and not self.__loop.is_closed():
+                self.__loop.call_soon_threadsafe(self.on_result, *result)
+            else:
+                self.on_result(*result)
+
+
+def run_worker(tg_token, handler, connection, bot_kwargs=None):
+    """Entry point of the worker process"""
+    asyncio.run(serve_worker(tg_token, handler, connection, bot_kwargs))
+
+
+async def serve_worker(tg_token, handler, connection, bot_kwargs=None):
+    """Handle updates received over the pipe until an empty message is received.
+
+    Args:
+        tg_token (str): token of the bot
+        handler: coroutine function taking Bot and Update instances
+        connection: multiprocessing connection to the parent process
+        bot_kwargs (dict): other parameters of `Bot`
+    """
+
+    loop = asyncio.get_running_loop()
+    async with httpx.AsyncClient() as session:
+        bot = Bot(tg_token, session, **(bot_kwargs or {}))
+
+        async def handle(update):
+            try:
+                result = (update.update_id, await handler(bot, update), None)
+            except Exception as error:
+                logger.exception('Failed to handle update %s', update.update_id)
+                result = (update.update_id, None, repr(error))
+            connection.send(result)
+
+        dispatcher = Dispatcher(handle)
+        while raw_update := await loop.run_in_executor(None, connection.recv_bytes):
+            try:
+                update = tg_obj.Update.parse_raw(raw_update)
+            except (ValidationError, ValueError) as error:
+                logger.exception('Failed to parse update')
+                connection.send((get_update_id(raw_update), None, repr(error)))
+                continue
+            await dispatcher(update)
+        await dispatcher.close()
+    connection.close()